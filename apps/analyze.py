@@ -1,87 +1,102 @@
+import os
+
 import dash_bootstrap_components as dbc
 import dash_html_components as html
 import dash_core_components as dcc
-import dash_table
 from dash.dependencies import State, Input, Output
 from dash.exceptions import PreventUpdate
-from dash import callback_context
+from dash import callback_context, no_update
 import plotly.express as px
-import pandas as pd
 import yaml
-from finance.client import Client  
-from finance.client.data_classes.accounts import Account
-from finance.client.data_classes.records import Record, RecordList
-from finance.client.data_classes.labels import Label
-from lib import create_total_col, compile_records
+
+from cache import LRUCache
+from data import (get_accounts, account_options, label_options, currency_options, job_queue,
+                  data_version, frame_key, load_frame, get_filter_index, get_latest_balance_index, get_rollup_index)
+from geo import country_balances
+from jobs import JOB_WAIT, new_session, report_progress
+from lib import create_group_totals, create_total_col, downsample
+from metrics import span, timed
+from rollups import ROLLUP_LABELS
 
 from app import app
 
 with open('config.yml') as file:
     config = yaml.load(file, Loader=yaml.FullLoader)
 
-client = Client(**config['database']) 
-
-records = client.records.list()
-
-accounts = client.accounts.list()
-account_options = [{'label':account.name, 'value':account.id} for account in accounts]
+def country_code_options():
+    country_codes = list(set([account.country_code for account in get_accounts()]))
+    return [{'label':code, 'value': code} for code in country_codes]
 
-country_codes = list(set([account.country_code for account in accounts]))
-country_code_options = [{'label':code, 'value': code} for code in country_codes]
+### ACCOUNT SELECTION ###
+# the dropdowns listing accounts, currencies, countries and labels are built
+# per page load, the module level components are shared by every session
+def account_dropdown():
+    return dcc.Dropdown(
+        id='account-dropdown',
+        options=account_options(), 
+        multi=True, 
+        className='mb-2',
+        placeholder='Account'
+    )
 
-labels = client.labels.list()
-labels_options = [{'label':label.name, 'value':label.id} for label in labels]
+def currency_dropdown():
+    return dcc.Dropdown(
+        id='currency-dropdown',
+        placeholder='Currency',
+        className='mb-2',
+        options=currency_options(),
+        value=config['app']['default_currency']
+    )
 
-currency_codes = client._currency_codes
-currency_options = [{'label': code, 'value':code} for code in currency_codes]
+def country_code_dropdown():
+    return dcc.Dropdown(
+        id='country-code-dropdown',
+        options=country_code_options(), 
+        multi=True, 
+        className='mb-2',
+        placeholder='Country'
+    )
+    
+def label_dropdown():
+    return dcc.Dropdown(
+        id='label-dropdown',
+        options=label_options(), 
+        multi=True, 
+        className='mb-2',
+        placeholder='Type')
 
-### RECORDS DATA STORE ###
-compiled_records_df = compile_records(
-    client=client,
-    records=records.convert_currency(currency=config['app']['default_currency']).to_pandas(),
-    accounts=accounts,
-    labels=labels
+date_range = dcc.DatePickerRange(
+    id='date-picker-range', 
+    className='mb-2'
 )
 
-initial_data_store = compiled_records_df.to_json()
-
-data_store = dcc.Store(id='data-store', data=initial_data_store)
-
-### ACCOUNT SELECTION ###
-account_dropdown = dcc.Dropdown(
-    id='account-dropdown',
-    options=account_options, 
-    multi=True, 
-    className='mb-2',
-    placeholder='Account'
-)       
-
-currency_dropdown = dcc.Dropdown(
-    id='currency-dropdown',
-    placeholder='Currency',
+# 'auto' plots from the coarsest rollup that still resolves the visible range
+granularity_dropdown = dcc.Dropdown(
+    id='granularity-dropdown',
+    placeholder='Granularity',
     className='mb-2',
-    options=currency_options,
-    value=config['app']['default_currency']
+    options=(
+        [{'label': 'Auto', 'value': 'auto'}]
+        + [{'label': label, 'value': freq} for freq, label in ROLLUP_LABELS.items()]
+        + [{'label': 'Every record', 'value': 'records'}]
+    ),
+    value='auto',
+    clearable=False
 )
 
-country_code_dropdown = dcc.Dropdown(
-    id='country-code-dropdown',
-    options=country_code_options, 
-    multi=True, 
-    className='mb-2',
-    placeholder='Country'
-)
-    
-label_dropdown = dcc.Dropdown(
-    id='label-dropdown',
-    options=labels_options, 
-    multi=True, 
-    className='mb-2',
-    placeholder='Type')
+# a line per account, or per label or country summed over their accounts
+LINE_GROUPS = {'name_label': 'Label', 'country_code': 'Country'}
 
-date_range = dcc.DatePickerRange(
-    id='date-picker-range', 
-    className='mb-2'
+line_group_dropdown = dcc.Dropdown(
+    id='line-group-dropdown',
+    placeholder='Lines per',
+    className='mb-2',
+    options=(
+        [{'label': 'Account', 'value': 'account'}]
+        + [{'label': label, 'value': col} for col, label in LINE_GROUPS.items()]
+    ),
+    value='account',
+    clearable=False
 )
 
 filter_button = dbc.Button(
@@ -98,18 +113,21 @@ clear_filter_button = dbc.Button(
 )
 
 ### SIDEBAR ###
-side_bar = html.Div(
-    [
-        account_dropdown,
-        currency_dropdown,
-        country_code_dropdown,
-        label_dropdown,
-        date_range,
-        filter_button, 
-        clear_filter_button
-    ],
-    style={'height':'100vh'}
-)
+def side_bar():
+    return html.Div(
+        [
+            account_dropdown(),
+            currency_dropdown(),
+            country_code_dropdown(),
+            label_dropdown(),
+            date_range,
+            granularity_dropdown,
+            line_group_dropdown,
+            filter_button, 
+            clear_filter_button
+        ],
+        style={'height':'100vh'}
+    )
 
 ### GRAPH ###
 graph_type_selection = dbc.ButtonGroup(
@@ -122,27 +140,73 @@ graph_type_selection = dbc.ButtonGroup(
 
 graph = dbc.Card(dcc.Loading(dcc.Graph(id='graph')))
 
+# the running graph job and how often the browser asks for its progress
+graph_job_store = dcc.Store(id='graph-job-store')
+graph_job_interval = dcc.Interval(id='graph-job-interval', interval=500, disabled=True)
+graph_progress = html.Div(id='graph-progress', className='mt-2')
+
+# the browser checks the data version every few seconds and redraws when
+# records were added
+data_version_interval = dcc.Interval(
+    id='data-version-interval',
+    interval=config['app'].get('data_version_poll', 10) * 1000
+)
+
+# window width in pixels, the plot is downsampled to about one point per pixel
+graph_width_store = dcc.Store(id='graph-width-store')
+
+DEFAULT_GRAPH_WIDTH = 1000
+GRAPH_WIDTH_FRACTION = 0.75
+
+# finished figures, keyed on the data-store key and the normalized filters
+figure_cache = LRUCache(
+    maxsize=config['app'].get('figure_cache_size', 64),
+    ttl=config['app'].get('figure_cache_ttl', 600)
+)
+
 ### BODY ###
-body = html.Div(
-    dbc.Row(
-        [
-            dbc.Col(
-                side_bar, 
-                className='m-2',
-                width=3),
-            dbc.Col(
-                [
-                    dbc.Row(graph_type_selection, justify='end', className='mt-2'),
-                    dbc.Row(dbc.Col(graph), className='mt-2')
-                ], 
-                className='mr-4'
-            )
-        ]
+def body():
+    return html.Div(
+        dbc.Row(
+            [
+                dbc.Col(
+                    side_bar(), 
+                    className='m-2',
+                    width=3),
+                dbc.Col(
+                    [
+                        dbc.Row(graph_type_selection, justify='end', className='mt-2'),
+                        dbc.Row(dbc.Col(graph_progress)),
+                        dbc.Row(dbc.Col(graph), className='mt-2')
+                    ], 
+                    className='mr-4'
+                )
+            ]
+        )
     )
-)
 
 ### LAYOUT ###
-layout = html.Div([body, data_store])
+def layout():
+    data_store = dcc.Store(id='data-store', data=frame_key(config['app']['default_currency']))
+    session_store = dcc.Store(id='session-store', data=new_session())
+    
+    # the data version the graph was drawn from, with the id of the process that counted it
+    data_version_store = dcc.Store(id='data-version-store', data=process_data_version())
+    
+    return html.Div([
+        body(), data_store, graph_width_store, session_store, graph_job_store, graph_job_interval,
+        data_version_store, data_version_interval
+    ])
+
+app.clientside_callback(
+    """
+    function(id) {
+        return window.innerWidth;
+    }
+    """,
+    Output('graph-width-store', 'data'),
+    [Input('graph', 'id')]
+)
 
 @app.callback(
     [Output('account-dropdown', 'value'),
@@ -150,142 +214,306 @@ layout = html.Div([body, data_store])
      Output('label-dropdown', 'value'),
      Output('date-picker-range', 'start_date'),
      Output('date-picker-range', 'end_date'),
-     Output('currency-dropdown', 'value')],
+     Output('currency-dropdown', 'value'),
+     Output('granularity-dropdown', 'value'),
+     Output('line-group-dropdown', 'value')],
     [Input('clear-filter-button', 'n_clicks')],
 )
 def clear_filters(click):
     
-    return None, None, None, None, None, config['app']['default_currency']
+    return None, None, None, None, None, config['app']['default_currency'], 'auto', 'account'
 
 @app.callback(
-    Output('graph', 'figure'),
+    Output('graph-job-store', 'data'),
     [Input('filter-button', 'n_clicks'),
      Input('plot-graph-button', 'n_clicks'),
      Input('plot-graph-button', 'n_clicks_timestamp'),
      Input('tree-graph-button', 'n_clicks'),
      Input('tree-graph-button', 'n_clicks_timestamp'),
      Input('map-graph-button', 'n_clicks'),
-     Input('map-graph-button', 'n_clicks_timestamp')],
+     Input('map-graph-button', 'n_clicks_timestamp'),
+     Input('graph', 'relayoutData'),
+     Input('data-version-store', 'data')],
     [State('data-store','data'),
      State('account-dropdown', 'value'),
      State('country-code-dropdown', 'value'),
      State('label-dropdown', 'value'),
      State('date-picker-range', 'start_date'),
      State('date-picker-range', 'end_date'),
-     State('currency-dropdown', 'value')]
+     State('currency-dropdown', 'value'),
+     State('granularity-dropdown', 'value'),
+     State('line-group-dropdown', 'value'),
+     State('graph-width-store', 'data'),
+     State('session-store', 'data')]
 )
+@timed('update_graph')
 def update_graph(filter_click, plot_click, plot_timestamp, tree_click, tree_timestamp,
-                 map_click, map_timestamp, data_store, account_ids, country_codes, 
-                 label_ids, date_start, date_end, currency_code):
+                 map_click, map_timestamp, relayout_data, seen_version, data_store, account_ids, country_codes, 
+                 label_ids, date_start, date_end, currency_code, granularity, line_group, graph_width, session):
     
     ctx = callback_context
     trigger_button = ctx.triggered[0]['prop_id'].split('.')[0]
+    
+    # the graph type follows the last graph button clicked
+    graph_type = shown_graph(plot_timestamp, tree_timestamp, map_timestamp)
+    
+    # zooming the plot re-samples the visible window, other relayouts are ignored
+    x_range = None
+    if trigger_button == 'graph':
+        if not relayout_data or graph_type != 'plot':
+            raise PreventUpdate
+        elif 'xaxis.range[0]' in relayout_data:
+            x_range = (relayout_data['xaxis.range[0]'], relayout_data['xaxis.range[1]'])
+        elif 'xaxis.autorange' not in relayout_data:
+            raise PreventUpdate
+    elif trigger_button == 'data-version-store' and graph_type == 'plot':
+        # new records keep the zoom
+        if relayout_data and 'xaxis.range[0]' in relayout_data:
+            x_range = (relayout_data['xaxis.range[0]'], relayout_data['xaxis.range[1]'])
+    
+    n_points = int((graph_width or DEFAULT_GRAPH_WIDTH) * GRAPH_WIDTH_FRACTION)
+    
+    # the figure is built by a background job, poll_graph_job picks it up
+    return job_queue.submit(
+        session,
+        'graph',
+        render_graph,
+        graph_type,
+        data_store,
+        account_ids,
+        country_codes,
+        label_ids,
+        date_start,
+        date_end,
+        currency_code,
+        granularity,
+        line_group,
+        x_range,
+        n_points
+    )
 
-    compiled_df = pd.read_json(data_store)
+@app.callback(
+    [Output('graph', 'figure'),
+     Output('graph-progress', 'children'),
+     Output('graph-job-interval', 'disabled')],
+    [Input('graph-job-store', 'data'),
+     Input('graph-job-interval', 'n_intervals')]
+)
+@timed('poll_graph_job')
+def poll_graph_job(job_store, n_intervals):
     
-    if account_ids:
-        account_filter = compiled_df['account_id'].isin(account_ids)
-    else:
-        account_filter = pd.Series([True]*len(compiled_df))
-        
-    if country_codes:
-        country_filter = compiled_df['country_code'].isin(country_codes)
-    else:
-        country_filter = pd.Series([True]*len(compiled_df))
-        
-    if label_ids:
-        label_filter = compiled_df['label_id'].isin(label_ids)
-    else:
-        label_filter = pd.Series([True]*len(compiled_df))
-        
-    if date_start:
-        start_filter = compiled_df['date'] > date_start
-    else:
-        start_filter = pd.Series([True]*len(compiled_df))
-        
-    if date_end:
-        end_filter = compiled_df['date'] < date_end
-    else:
-        end_filter = pd.Series([True]*len(compiled_df))
+    if job_store is None:
+        raise PreventUpdate
+    
+    # a new job gets a moment to finish so cached figures come back at once
+    ctx = callback_context
+    new_job = ctx.triggered[0]['prop_id'].startswith('graph-job-store')
+    job = job_queue.poll(job_store, render_graph, timeout=JOB_WAIT if new_job else 0)
+    
+    if job.state == 'done':
+        return job.result, None, True
+    elif job.state == 'failed':
+        return no_update, dbc.Alert(f'Could not draw the graph: {job.message}', color='danger'), True
+    elif job.state == 'cancelled':
+        return no_update, no_update, True
+    
+    progress = dbc.Progress(job.message, value=int(job.progress * 100), striped=True, animated=True)
+    
+    return no_update, progress, False
+
+@timed('render_graph')
+def render_graph(graph_type, data_store, account_ids, country_codes, label_ids, date_start, date_end,
+                 currency_code, granularity, line_group, x_range, n_points):
+    
+    x_range = tuple(x_range) if x_range else None
+    
+    report_progress(0.1, 'Loading records')
+    with span('load_frame'):
+        data_store, compiled_df = load_frame(data_store, currency_code or config['app']['default_currency'])
+    
+    figure_key = (
+        graph_type,
+        data_store,
+        tuple(sorted(account_ids or [])),
+        tuple(sorted(country_codes or [])),
+        tuple(sorted(label_ids or [])),
+        date_start,
+        date_end,
+        x_range if graph_type == 'plot' else None,
+        n_points if graph_type == 'plot' else None,
+        granularity if graph_type == 'plot' else None,
+        line_group if graph_type == 'plot' else None
+    )
+    fig = figure_cache.get(figure_key)
+    
+    if fig is not None:
+        return fig
+    
+    report_progress(0.4, 'Filtering')
+    with span('filter'):
+        filter_index = get_filter_index(data_store, compiled_df)
         
-    compiled_df = compiled_df[account_filter & country_filter & label_filter & start_filter & end_filter]        
+        mask = filter_index.mask(
+            account_ids=account_ids,
+            country_codes=country_codes,
+            label_ids=label_ids,
+            date_start=date_start,
+            date_end=date_end
+        )
+        full_df = compiled_df
+        compiled_df = compiled_df[mask]
+    
+    # the unfiltered total matrix is cached per key and kept current by the change feed
+    total_cache_key = data_store if mask.all() else None
 
     graph_labels={
         f'balance':f'Balance ({currency_code})', 
         'name_account':'Account',
-        'date':'Date'
+        'date':'Date',
+        'country_code':'Country',
+        'accounts':'Accounts'
     }
 
-    def create_treemap(compiled_df):
+    def latest_balances():
         
-        most_recent_records = compiled_df[['name_account', 'date']].groupby(['name_account'], as_index=False).max()
-        current_balances = most_recent_records.merge(compiled_df, on=['name_account','date'], how='left')
+        # one row per account: its latest record in the date range, kept if it passes the filters
+        with span('latest_balances'):
+            latest_positions = get_latest_balance_index(data_store, full_df).latest(date_start, date_end)
+            return full_df.iloc[latest_positions[mask[latest_positions]]]
+    
+    def create_treemap():
         
-        fig = px.treemap(
-            current_balances,
-            names='name_account',
-            values=f'balance',
-            path=['name_label','name_account'],
-            labels=graph_labels
-        )
+        current_balances = latest_balances()
+        
+        with span('figure'):
+            fig = px.treemap(
+                current_balances,
+                names='name_account',
+                values=f'balance',
+                path=['name_label','name_account'],
+                labels=graph_labels
+            )
         
         return fig
     
     def create_plot(compiled_df):
         
-        compiled_df = create_total_col(compiled_df, 'balance')
-    
-        fig = px.line(
-            compiled_df.sort_values('date'),
-            x='date',
-            y=f'balance',
-            color='name_account',
-            labels=graph_labels,
-        )
+        # the visible range decides how coarse a rollup can stand in for the records
+        with span('rollup'):
+            rollup_index = get_rollup_index(data_store, full_df)
+            visible_range = x_range or (
+                date_start or filter_index.sorted_dates[0],
+                date_end or filter_index.sorted_dates[-1]
+            )
+            freq = rollup_index.choose(granularity, *visible_range)
+            
+            cache_key = total_cache_key
+            if freq:
+                positions = rollup_index.positions(freq)
+                compiled_df = full_df.iloc[positions[mask[positions]]]
+                cache_key = (total_cache_key, freq) if total_cache_key else None
         
-        fig.update_traces(mode='markers+lines')
+        if line_group in LINE_GROUPS:
+            # one line per label or country, interpolated and summed like the Total
+            with span('group_totals'):
+                compiled_df = create_group_totals(compiled_df, 'balance', line_group, cache_key=cache_key)
+            graph_labels['name_account'] = LINE_GROUPS[line_group]
+        else:
+            with span('total_col'):
+                compiled_df = create_total_col(compiled_df, 'balance', cache_key=cache_key)
         
-        return fig    
+        with span('downsample'):
+            compiled_df = downsample(
+                compiled_df,
+                n_points=n_points,
+                x_range=x_range,
+                method=config['app'].get('downsample_method', 'minmax')
+            )
     
-    def create_map(compiled_df):
+        with span('figure'):
+            fig = px.line(
+                compiled_df.sort_values('date'),
+                x='date',
+                y=f'balance',
+                color='name_account',
+                labels=graph_labels,
+            )
         
-        comp
-    
-    if trigger_button == 'tree-graph-button':
-        return create_treemap(compiled_df)
-    
-    elif trigger_button == 'filter-button':
+        fig.update_traces(mode='markers+lines')
+        fig.update_layout(uirevision='plot')
         
-        if tree_timestamp == None and plot_timestamp == None:
-            return create_plot(compiled_df)
+        if x_range:
+            fig.update_xaxes(range=x_range)
         
-        elif tree_timestamp == None or plot_timestamp == None:
-            if tree_timestamp:
-                return create_treemap(compiled_df)
-            else:
-                return create_plot(compiled_df)
+        return fig    
+    
+    def create_map():
         
-        elif tree_timestamp > plot_timestamp:
-            return create_treemap(compiled_df)
+        with span('country_balances'):
+            countries = country_balances(latest_balances())
         
-        else:
-            return create_plot(compiled_df)
+        with span('figure'):
+            fig = px.choropleth(
+                countries.dropna(subset=['iso_alpha']),
+                locations='iso_alpha',
+                color='balance',
+                hover_name='country_code',
+                hover_data=['accounts'],
+                labels=graph_labels,
+                color_continuous_scale='Blues'
+            )
+            fig.update_layout(margin={'l': 0, 'r': 0, 't': 0, 'b': 0})
         
+        return fig
+    
+    report_progress(0.6, 'Drawing')
+    if graph_type == 'tree':
+        fig = create_treemap()
+    elif graph_type == 'map':
+        fig = create_map()
     else:
-        return create_plot(compiled_df)
+        fig = create_plot(compiled_df)
+        
+    return figure_cache.put(figure_key, fig)
+    
+def process_data_version():
+    # the data version with the id of the process that counted it
+    return [os.getpid(), data_version()]
+
+def shown_graph(plot_timestamp, tree_timestamp, map_timestamp):
+    
+    timestamps = {'plot': plot_timestamp, 'tree': tree_timestamp, 'map': map_timestamp}
+    clicked = {graph_type: timestamp for graph_type, timestamp in timestamps.items() if timestamp}
+    
+    if not clicked:
+        return 'plot'
+    
+    return max(clicked, key=clicked.get)
     
 
+@app.callback(
+    Output('data-version-store', 'data'),
+    [Input('data-version-interval', 'n_intervals')],
+    [State('data-version-store', 'data')]
+)
+def check_data_version(n_intervals, seen_version):
+    
+    # unchanged data sends nothing back, a new version redraws the graph,
+    # whose job catches the frame up to it. each process counts its own
+    # changes, so under several workers a version is only compared with one
+    # from the same process and the others leave the store alone.
+    version = process_data_version()
+    if seen_version and (seen_version[0] != version[0] or seen_version[1] == version[1]):
+        raise PreventUpdate
+    
+    return version
+
 @app.callback(
     Output('data-store','data'),
     [Input('currency-dropdown', 'value')],
 )
+@timed('update_data_store_currency')
 def update_data_store_currency(currency):
     
-    compiled_records_df = compile_records(
-        client=client, 
-        records=records.convert_currency(currency=currency).to_pandas(),
-        accounts=accounts,
-        labels=labels,
-    )
-    
-    return compiled_records_df.to_json()
+    # only the key, the graph job converts the balances if they aren't cached
+    return frame_key(currency)
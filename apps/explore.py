@@ -1,34 +1,30 @@
+import base64
+import io
 import dash_bootstrap_components as dbc
 import dash_html_components as html
 import dash_core_components as dcc
 import dash_table
 from dash.dependencies import State, Input, Output
 from dash.exceptions import PreventUpdate
+from dash import no_update
 from dash import callback_context
 import yaml
-from finance.client import Client  
 from finance.client.data_classes.accounts import Account
 from finance.client.data_classes.records import Record
 from finance.client.data_classes.labels import Label
+from data import (checkout_client, get_country_codes, account_options, label_options, currency_options,
+                  job_queue, query_table, created_records, records_created, account_created, label_created)
+from jobs import JOB_WAIT, new_session, report_progress
+from metrics import span, timed
+from importer import import_records, format_report
 
 from app import app
 
 with open('config.yml') as file:
     config = yaml.load(file, Loader=yaml.FullLoader)
 
-client = Client(**config['database']) 
-
-accounts = client.accounts.list()
-account_options = [{'label':account.name, 'value':account.id} for account in accounts]
-
-country_codes = client._country_codes
-country_code_options = [{'label':code, 'value': code} for code in country_codes]
-
-labels = client.labels.list()
-labels_options = [{'label':label.name, 'value':label.id} for label in labels]
-
-currency_codes = client._currency_codes
-currency_options = [{'label': code, 'value':code} for code in currency_codes]
+def country_code_options():
+    return [{'label':code, 'value': code} for code in get_country_codes()]
 
 ### DATA TYPE SELECTOR ###
 data_type_buttons = dbc.ButtonGroup(
@@ -41,44 +37,71 @@ data_type_buttons = dbc.ButtonGroup(
 )
 
 ### ACCOUNT SELECTION ###
-account_dropdown = dcc.Dropdown(
-    options=account_options, 
-    multi=True, 
-    className='mb-2',
-    placeholder='Account'
-)       
-
-country_code_dropdown = dcc.Dropdown(
-    options=country_code_options, 
-    multi=True, 
-    className='mb-2',
-    placeholder='Country'
-)
+# the dropdowns listing accounts, currencies, countries and labels are built
+# when they are shown, the module level components are shared by every session
+def account_dropdown():
+    return dcc.Dropdown(
+        options=account_options(), 
+        multi=True, 
+        className='mb-2',
+        placeholder='Account'
+    )
+
+def country_code_dropdown():
+    return dcc.Dropdown(
+        options=country_code_options(), 
+        multi=True, 
+        className='mb-2',
+        placeholder='Country'
+    )
     
-label_dropdown = dcc.Dropdown(
-    options=labels_options, 
-    multi=True, 
-    className='mb-2',
-    placeholder='Type')
+def label_dropdown():
+    return dcc.Dropdown(
+        options=label_options(), 
+        multi=True, 
+        className='mb-2',
+        placeholder='Type')
 
 date_range = dcc.DatePickerRange(id='date-picker-range', className='mb-2')
 
-account_filter_form = dbc.Form(
-    [
-        account_dropdown,
-        label_dropdown, 
-        country_code_dropdown,
-    ]
-)
+def account_filter_form():
+    return dbc.Form(
+        [
+            account_dropdown(),
+            label_dropdown(), 
+            country_code_dropdown(),
+        ]
+    )
 
-record_filter_form = dbc.Form(
-    [
-        account_dropdown,
-        date_range,
-        label_dropdown, 
-    ]
+### RECORD IMPORT ###
+def record_upload_account_dropdown():
+    return dcc.Dropdown(
+        id='record-upload-account-dropdown',
+        options=account_options(),
+        className='mb-2',
+        placeholder='Import into account'
+    )
+
+record_upload = dcc.Upload(
+    dbc.Button('Import CSV/OFX', color='info'),
+    id='record-upload',
+    className='mb-2'
 )
 
+record_upload_status = html.Div(id='record-upload-status', className='mb-2')
+
+def record_filter_form():
+    return dbc.Form(
+        [
+            account_dropdown(),
+            date_range,
+            label_dropdown(), 
+            record_upload_account_dropdown(),
+            record_upload,
+            record_upload_status
+        ]
+    )
+
 label_filter_form = dbc.Form()
 
 ### SIDEBAR ###
@@ -91,12 +114,18 @@ side_bar = html.Div(
 )
 
 ### TABLE ###
-records_df = client.records.list().to_pandas()
-
+# paged, sorted and filtered on the server so only one page is ever sent
 table_placeholder = dash_table.DataTable(
     id='table',
     style_as_list_view=True,
-    page_size=20
+    page_current=0,
+    page_size=20,
+    page_action='custom',
+    sort_action='custom',
+    sort_mode='multi',
+    sort_by=[],
+    filter_action='custom',
+    filter_query=''
 )
 
 ### CREATE POPUP ###
@@ -126,52 +155,55 @@ create_account_description_input = dbc.FormGroup(
     ]
 )
 
-create_account_label_dropdown = dbc.FormGroup(
-    [
-        dbc.Label("Label"),
-        dcc.Dropdown(
-            id='create-account-label-dropdown',
-            placeholder='Label',
-            options=labels_options
-        )
-    ]
-)
+def create_account_label_dropdown():
+    return dbc.FormGroup(
+        [
+            dbc.Label("Label"),
+            dcc.Dropdown(
+                id='create-account-label-dropdown',
+                placeholder='Label',
+                options=label_options()
+            )
+        ]
+    )
 
-create_account_country_dropdown = dbc.FormGroup(
-    [
-        dbc.Label("Country"),
-        dcc.Dropdown(
-            id='create-account-country-dropdown',
-            placeholder='Country',
-            options=country_code_options
-        )
-    ]
-)
+def create_account_country_dropdown():
+    return dbc.FormGroup(
+        [
+            dbc.Label("Country"),
+            dcc.Dropdown(
+                id='create-account-country-dropdown',
+                placeholder='Country',
+                options=country_code_options()
+            )
+        ]
+    )
 
-create_account_modal = dbc.Modal(
-    [
-        dbc.ModalBody(
-            dbc.Form([
-                create_account_name_input,
-                create_account_description_input,
-                create_account_label_dropdown,
-                create_account_country_dropdown
-            ])
-        ),
-        dbc.ModalFooter(
-            [   
-                dbc.Button(
-                    "Close", id="close-create-account-modal", **MODAL_CLOSE_BUTTON_STYLE
-                ),
-                dbc.Button(
-                    "Create", id="create-create-account-modal", **MODAL_CREATE_BUTTON_STYLE
-                )
-            ]
-        ),
-    ],
-    id="create-account-modal",
-    centered=True,
-)
+def create_account_modal():
+    return dbc.Modal(
+        [
+            dbc.ModalBody(
+                dbc.Form([
+                    create_account_name_input,
+                    create_account_description_input,
+                    create_account_label_dropdown(),
+                    create_account_country_dropdown()
+                ])
+            ),
+            dbc.ModalFooter(
+                [   
+                    dbc.Button(
+                        "Close", id="close-create-account-modal", **MODAL_CLOSE_BUTTON_STYLE
+                    ),
+                    dbc.Button(
+                        "Create", id="create-create-account-modal", **MODAL_CREATE_BUTTON_STYLE
+                    )
+                ]
+            ),
+        ],
+        id="create-account-modal",
+        centered=True,
+    )
 
 create_label_name_input = dbc.FormGroup(
     [
@@ -210,27 +242,29 @@ create_label_modal = dbc.Modal(
     centered=True,
 )
 
-create_record_account_dropdown = dbc.FormGroup(
-    [
-        dbc.Label("Account"),
-        dcc.Dropdown(
-            id='create-record-account-dropdown',
-            placeholder='Account',
-            options=account_options
-        )
-    ]
-)
+def create_record_account_dropdown():
+    return dbc.FormGroup(
+        [
+            dbc.Label("Account"),
+            dcc.Dropdown(
+                id='create-record-account-dropdown',
+                placeholder='Account',
+                options=account_options()
+            )
+        ]
+    )
 
-create_record_currency_dropdown = dbc.FormGroup(
-    [
-        dbc.Label("Currency"),
-        dcc.Dropdown(
-            id='create-record-currency-dropdown',
-            placeholder='Currency',
-            options=currency_options
-        )
-    ]
-)
+def create_record_currency_dropdown():
+    return dbc.FormGroup(
+        [
+            dbc.Label("Currency"),
+            dcc.Dropdown(
+                id='create-record-currency-dropdown',
+                placeholder='Currency',
+                options=currency_options()
+            )
+        ]
+    )
 
 create_record_balance_input = dbc.FormGroup(
     [
@@ -247,30 +281,33 @@ create_record_date_input = dbc.FormGroup(
 )
 
 
-create_record_modal = dbc.Modal(
-    [
-        dbc.ModalBody(
-            dbc.Form([
-                create_record_account_dropdown,
-                create_record_balance_input,
-                create_record_currency_dropdown,
-                create_record_date_input
-            ])
-        ),
-        dbc.ModalFooter(
-            [   
-                dbc.Button(
-                    "Close", id="close-create-record-modal", **MODAL_CLOSE_BUTTON_STYLE
-                ),
-                dbc.Button(
-                    "Create", id="create-create-record-modal", **MODAL_CREATE_BUTTON_STYLE
-                )
-            ]
-        ),
-    ],
-    id="create-record-modal",
-    centered=True,
-)
+def create_record_modal():
+    return dbc.Modal(
+        [
+            dbc.ModalBody(
+                dbc.Form([
+                    create_record_account_dropdown(),
+                    create_record_balance_input,
+                    create_record_currency_dropdown(),
+                    create_record_date_input
+                ])
+            ),
+            dbc.ModalFooter(
+                [   
+                    dbc.Button(
+                        "Close", id="close-create-record-modal", **MODAL_CLOSE_BUTTON_STYLE
+                    ),
+                    dbc.Button(
+                        "Create", id="create-create-record-modal", **MODAL_CREATE_BUTTON_STYLE
+                    )
+                ]
+            ),
+        ],
+        id="create-record-modal",
+        centered=True,
+    )
+
+table_progress = html.Div(id='table-progress', className='mt-2')
 
 ### BODY ###
 body = html.Div(
@@ -287,6 +324,7 @@ body = html.Div(
                         justify='end',
                         className='mt-2'
                     ),
+                    dbc.Row(dbc.Col(table_progress)),
                     dbc.Row(
                         dbc.Col(table_placeholder),
                         className='mt-2')
@@ -300,19 +338,30 @@ body = html.Div(
 ### DATA TYPE STORE ###
 temp_val_store = dcc.Store(id='temp-val-store')
 data_type_store = dcc.Store(id='data-type-store')
+table_version_store = dcc.Store(id='table-version-store')
+import_version_store = dcc.Store(id='import-version-store')
+
+# the running table job and how often the browser asks for its progress
+table_job_store = dcc.Store(id='table-job-store')
+table_job_interval = dcc.Interval(id='table-job-interval', interval=500, disabled=True)
 
 ### LAYOUT ###
-layout = html.Div([
-    data_type_store, 
-    create_account_modal, create_label_modal, create_record_modal, 
-    body
-])
+def layout():
+    session_store = dcc.Store(id='session-store', data=new_session())
+    
+    return html.Div([
+        data_type_store, table_version_store, import_version_store,
+        session_store, table_job_store, table_job_interval,
+        create_account_modal(), create_label_modal, create_record_modal(), 
+        body
+    ])
 
 ### CALLBACKS ###
 @app.callback(
     [Output("create-account-modal", "is_open"),
      Output("create-label-modal", "is_open"),
-     Output("create-record-modal", "is_open")],
+     Output("create-record-modal", "is_open"),
+     Output('table-version-store', 'data')],
     [Input('create-button', 'n_clicks'),
      Input("close-create-account-modal", "n_clicks"),
      Input("close-create-label-modal", "n_clicks"),
@@ -335,6 +384,7 @@ layout = html.Div([
      State('create-record-currency-dropdown', 'value'),
      State('create-record-date-input', 'value')],
 )
+@timed('close_modal')
 def close_modal(create_n, close_account_n, close_label_n, close_record_n,
                 create_account_n, create_label_n, create_record_n,
                 data_type_store, account_is_open, label_is_open, record_is_open,
@@ -352,9 +402,13 @@ def close_modal(create_n, close_account_n, close_label_n, close_record_n,
                 label_id=account_label,
                 country_code=account_country
             )
-            client.accounts.create(new_account)
+            with checkout_client() as client, span('accounts.create'):
+                client.accounts.create(new_account)
+            account_created(new_account)
+            
+            return not account_is_open, label_is_open, record_is_open, 'accounts:' + str(create_account_n)
             
-        return not account_is_open, label_is_open, record_is_open
+        return not account_is_open, label_is_open, record_is_open, no_update
     
     elif data_type_store == 'labels':
         if trigger_button == 'create-create-label-modal':
@@ -362,9 +416,13 @@ def close_modal(create_n, close_account_n, close_label_n, close_record_n,
                 name=label_name,
                 description=label_description,
             )
-            client.labels.create(new_label)
+            with checkout_client() as client, span('labels.create'):
+                client.labels.create(new_label)
+            label_created(new_label)
             
-        return account_is_open, not label_is_open, record_is_open
+            return account_is_open, not label_is_open, record_is_open, 'labels:' + str(create_label_n)
+            
+        return account_is_open, not label_is_open, record_is_open, no_update
     
     elif data_type_store == 'records':
         if trigger_button == 'create-create-record-modal':
@@ -374,9 +432,14 @@ def close_modal(create_n, close_account_n, close_label_n, close_record_n,
                 balance=record_balance,
                 date=record_date
             )
-            client.records.create(new_record)
+            with checkout_client() as client, span('records.create'):
+                created = client.records.create(new_record)
+            # the stored record carries the id the change feed needs
+            records_created(created_records(created, [new_record]))
+            
+            return account_is_open, label_is_open, not record_is_open, 'records:' + str(create_record_n)
             
-        return account_is_open, label_is_open, not record_is_open
+        return account_is_open, label_is_open, not record_is_open, no_update
     
     else:
         
@@ -384,8 +447,7 @@ def close_modal(create_n, close_account_n, close_label_n, close_record_n,
         
         
 @app.callback(
-    [Output('table', 'columns'),
-     Output('table', 'data'),
+    [Output('table', 'page_current'),
      Output('sidebar-content', 'children'),
      Output('data-type-store', 'data')],
     [Input('accounts-button', 'n_clicks'),
@@ -395,28 +457,127 @@ def close_modal(create_n, close_account_n, close_label_n, close_record_n,
      Input("create-create-label-modal", "n_clicks"),
      Input("create-create-record-modal", "n_clicks")]
 )
+@timed('accounts_selection')
 def accounts_selection(account_n, record_n, label_n, 
                        create_account_n, create_label_n, create_record_n):
     
     ctx = callback_context
     trigger_button = ctx.triggered[0]['prop_id'].split('.')[0]
 
+    # the table job fills in the columns along with the first page
     if 'account' in trigger_button:
-        accounts_df = client.accounts.list().to_pandas()
-        data, columns = table_data_columns_formatter(accounts_df)
-        return columns, data, account_filter_form, 'accounts'
+        return 0, account_filter_form(), 'accounts'
     elif 'record' in trigger_button:
-        records_df = client.records.list().to_pandas()
-        data, columns = table_data_columns_formatter(records_df)
-        return columns, data, record_filter_form, 'records'
+        return 0, record_filter_form(), 'records'
     elif 'label' in trigger_button:
-        labels_df = client.labels.list().to_pandas()
-        data, columns = table_data_columns_formatter(labels_df)
-        return columns, data, label_filter_form, 'labels'
+        return 0, label_filter_form, 'labels'
     else:
         raise PreventUpdate
+
+
+@app.callback(
+    Output('table-job-store', 'data'),
+    [Input('data-type-store', 'data'),
+     Input('table-version-store', 'data'),
+     Input('import-version-store', 'data'),
+     Input('table', 'page_current'),
+     Input('table', 'page_size'),
+     Input('table', 'sort_by'),
+     Input('table', 'filter_query')],
+    [State('session-store', 'data')]
+)
+@timed('update_table_page')
+def update_table_page(data_type, table_version, import_version, page_current, page_size,
+                      sort_by, filter_query, session):
+    
+    if data_type is None:
+        raise PreventUpdate
+    
+    # listing a data type can be slow, poll_table_job picks up the page
+    return job_queue.submit(
+        session,
+        'table',
+        render_table_page,
+        data_type,
+        page_current or 0,
+        page_size,
+        sort_by,
+        filter_query
+    )
+
+@app.callback(
+    [Output('table', 'data'),
+     Output('table', 'page_count'),
+     Output('table', 'columns'),
+     Output('table-progress', 'children'),
+     Output('table-job-interval', 'disabled')],
+    [Input('table-job-store', 'data'),
+     Input('table-job-interval', 'n_intervals')]
+)
+@timed('poll_table_job')
+def poll_table_job(job_store, n_intervals):
+    
+    if job_store is None:
+        raise PreventUpdate
+    
+    ctx = callback_context
+    new_job = ctx.triggered[0]['prop_id'].startswith('table-job-store')
+    job = job_queue.poll(job_store, render_table_page, timeout=JOB_WAIT if new_job else 0)
+    
+    if job.state == 'done':
+        data, page_count, columns = job.result
+        return data, page_count, columns, None, True
+    elif job.state == 'failed':
+        alert = dbc.Alert(f'Could not load the table: {job.message}', color='danger')
+        return no_update, no_update, no_update, alert, True
+    elif job.state == 'cancelled':
+        return no_update, no_update, no_update, no_update, True
+    
+    progress = dbc.Progress(job.message, value=int(job.progress * 100), striped=True, animated=True)
+    
+    return no_update, no_update, no_update, progress, False
+
+@timed('render_table_page')
+def render_table_page(data_type, page_current, page_size, sort_by, filter_query):
+    
+    report_progress(0.1, f'Loading {data_type}')
+    with span('query_table'):
+        df = query_table(data_type, filter_query, sort_by)
+    
+    report_progress(0.8, 'Formatting')
+    page_df = df.iloc[page_current*page_size:(page_current + 1)*page_size]
+    page_count = max(-(-len(df) // page_size), 1)
+    
+    data, columns = table_data_columns_formatter(page_df)
+    return data, page_count, columns
+    
+
+@app.callback(
+    [Output('record-upload-status', 'children'),
+     Output('import-version-store', 'data')],
+    [Input('record-upload', 'contents')],
+    [State('record-upload', 'filename'),
+     State('record-upload-account-dropdown', 'value')]
+)
+@timed('import_upload')
+def import_upload(contents, filename, account_id):
+    
+    if contents is None:
+        raise PreventUpdate
+    
+    content_type, content_string = contents.split(',', 1)
+    
+    try:
+        report = import_records(io.BytesIO(base64.b64decode(content_string)), filename, account_id=account_id)
+    except Exception as error:
+        return f'Import of {filename} failed: {error}', no_update
+    
+    return format_report(report), f"{filename}:{report['inserted']}"
+    
+def table_columns(df):
+    return [{'id': col, 'name': col} for col in df.columns]
     
 def table_data_columns_formatter(df):
     data=df.to_dict('records')
-    columns=[{'id': col, 'name': col} for col in df.columns]
+    columns=table_columns(df)
     return data, columns
\ No newline at end of file
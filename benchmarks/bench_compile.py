@@ -0,0 +1,63 @@
+import sys
+import time
+
+import pandas as pd
+
+from benchmarks.synthetic import AccountList, LabelList, make_dataset
+from lib import compile_records
+
+SIZES = [
+    (50, 10_000),
+    (500, 100_000),
+    (500, 1_000_000),
+]
+
+
+def legacy_compile_records(client, records, accounts, labels):
+    # the original two hash merges
+    compiled_df = records.merge(
+        accounts.to_pandas(),
+        how='left',
+        left_on='account_id',
+        right_on='id',
+        suffixes=('_record', '_account')
+    )
+
+    return compiled_df.merge(
+        labels.to_pandas(),
+        how='left',
+        left_on='label_id',
+        right_on='id',
+        suffixes=('_account', '_label')
+    )
+
+
+def timed(func, *args, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main(sizes=SIZES):
+    print(f"{'accounts':>8} {'records':>9} {'merge (s)':>10} {'lookup (s)':>11} {'speedup':>8}")
+
+    for n_accounts, n_records in sizes:
+        accounts, labels, records = make_dataset(n_accounts, n_records)
+        args = (None, records, AccountList(accounts), LabelList(labels))
+
+        legacy_time, legacy_df = timed(legacy_compile_records, *args)
+        new_time, new_df = timed(compile_records, *args)
+
+        try:
+            pd.testing.assert_frame_equal(legacy_df, new_df, check_dtype=False, check_categorical=False)
+        except AssertionError as error:
+            sys.exit(f'Compiled records differ for {n_records} records:\n{error}')
+
+        print(f'{n_accounts:>8} {n_records:>9} {legacy_time:>10.3f} {new_time:>11.3f} {legacy_time / new_time:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
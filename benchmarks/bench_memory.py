@@ -0,0 +1,52 @@
+import sys
+
+import pandas as pd
+
+from benchmarks.synthetic import AccountList, LabelList, make_dataset
+from lib import compact_records, compile_records
+
+N_ACCOUNTS = 500
+N_RECORDS = 1_000_000
+
+
+def compiled_frame(n_accounts, n_records):
+    accounts, labels, records = make_dataset(n_accounts, n_records)
+    compiled_df = compile_records(None, records, AccountList(accounts), LabelList(labels))
+    compiled_df['date'] = pd.to_datetime(compiled_df['date'])
+
+    # strings as python objects, the way the frame was held before compacting
+    strings = compiled_df.select_dtypes(exclude=['number', 'datetime']).columns
+    return compiled_df.astype(dict.fromkeys(strings, object))
+
+
+def megabytes(n_bytes):
+    return n_bytes / 2**20
+
+
+def main(n_accounts=N_ACCOUNTS, n_records=N_RECORDS):
+    before = compiled_frame(n_accounts, n_records)
+    after = compact_records(before)
+
+    if not before.astype(str).equals(after.astype(str)):
+        sys.exit('Compacted frame differs from the compiled one')
+
+    before_usage = before.memory_usage(deep=True, index=False)
+    after_usage = after.memory_usage(deep=True, index=False)
+
+    print(f'{n_records} records, {n_accounts} accounts')
+    print(f"{'column':<20} {'before':>16} {'after':>16} {'MB before':>10} {'MB after':>9}")
+
+    for name in before.columns:
+        print(
+            f'{name:<20} {str(before[name].dtype):>16} {str(after[name].dtype):>16} '
+            f'{megabytes(before_usage[name]):>10.1f} {megabytes(after_usage[name]):>9.1f}'
+        )
+
+    total_before = megabytes(before_usage.sum())
+    total_after = megabytes(after_usage.sum())
+    print(f"{'total':<20} {'':>16} {'':>16} {total_before:>10.1f} {total_after:>9.1f}")
+    print(f'{total_before / total_after:.1f}x smaller')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import FakeClient
+from currency import CurrencyConverter
+from lib import compact_records, compile_records
+from query import RecordQuery, compile_chunks, convert_chunks, read_records
+
+N_ACCOUNTS = 500
+N_RECORDS = 1_000_000
+CHUNK_SIZES = (10_000, 100_000, 250_000)
+CURRENCY = 'USD'
+
+
+def compiler(client):
+    accounts = client.accounts.list()
+    labels = client.labels.list()
+
+    def compile(records_df):
+        compiled_df = compile_records(None, records_df, accounts, labels)
+        if compiled_df['date'].dtype.kind != 'M':
+            compiled_df['date'] = pd.to_datetime(compiled_df['date'])
+        return compact_records(compiled_df)
+
+    return compile
+
+
+def cold_load_listed(client, compile):
+    # as before the adapter: one list, compiled whole and converted whole
+    records = client.records.list()
+    converter = CurrencyConverter(
+        lambda currency: [records.convert_currency(currency=currency).to_pandas()],
+        compile(records.to_pandas())
+    )
+    return converter.balance_column(CURRENCY)
+
+
+def cold_load_streamed(client, compile, chunk_size):
+    # compiled and converted a page at a time, as data.py loads
+    converter = CurrencyConverter(
+        lambda currency: convert_chunks(client, RecordQuery(), currency, chunk_size),
+        compile_chunks(client, RecordQuery(), compile, chunk_size)
+    )
+    return converter.balance_column(CURRENCY)
+
+
+def measure(func, *args):
+    # seconds of one call, and MB allocated at the peak of another. tracing
+    # slows the allocations down too much to time under it.
+    start = time.perf_counter()
+    result = func(*args)
+    seconds = time.perf_counter() - start
+
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak / 2**20, result
+
+
+def main(n_accounts=N_ACCOUNTS, n_records=N_RECORDS):
+    client = FakeClient(n_accounts=n_accounts, n_records=n_records)
+    compile = compiler(client)
+
+    print(f'{n_records} records, {n_accounts} accounts\n')
+    print(f"{'load':<34} {'seconds':>8} {'peak (MB)':>10} {'rows':>9}")
+
+    # the whole table listed and compiled in one go, as before the adapter
+    seconds, peak, expected = measure(lambda: compile(client.records.list().to_pandas()))
+    print(f"{'full, one frame':<34} {seconds:>8.2f} {peak:>10.1f} {len(expected):>9}")
+
+    for chunk_size in CHUNK_SIZES:
+        seconds, peak, streamed = measure(compile_chunks, client, RecordQuery(), compile, chunk_size)
+        if not streamed.astype(str).equals(expected.astype(str)):
+            sys.exit(f'Streamed frame differs with chunks of {chunk_size}')
+        print(f"{f'full, chunks of {chunk_size}':<34} {seconds:>8.2f} {peak:>10.1f} {len(streamed):>9}")
+
+    # the cold start: records compiled and their first currency converted
+    seconds, peak, expected = measure(cold_load_listed, client, compile)
+    print(f"{f'cold load {CURRENCY}, listed':<34} {seconds:>8.2f} {peak:>10.1f} {len(expected):>9}")
+
+    for chunk_size in CHUNK_SIZES:
+        seconds, peak, streamed = measure(cold_load_streamed, client, compile, chunk_size)
+        if not np.allclose(streamed, expected):
+            sys.exit(f'Streamed conversion differs with chunks of {chunk_size}')
+        print(f"{f'cold load {CURRENCY}, chunks of {chunk_size}':<34} {seconds:>8.2f} {peak:>10.1f} {len(streamed):>9}")
+
+    # one account over one year: the filter pushed down against listing everything
+    query = RecordQuery(account_ids=[1], date_start='2016-01-01', date_end='2016-12-31')
+    seconds, peak, narrow = measure(read_records, client, query)
+    seconds_full, peak_full, everything = measure(lambda: client.records.list().to_pandas())
+    if len(everything[query.mask(everything)]) != len(narrow):
+        sys.exit('Pushed down query returned different rows')
+    print(f"{'one account-year, listed':<34} {seconds_full:>8.2f} {peak_full:>10.1f} {len(everything):>9}")
+    print(f"{'one account-year, pushed':<34} {seconds:>8.2f} {peak:>10.1f} {len(narrow):>9}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import yaml
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SIZES = [1_000, 10_000, 100_000, 1_000_000]
+
+CONFIG = {
+    'database': {},
+    'app': {'port': 8050, 'host': '127.0.0.1', 'default_currency': 'EUR'},
+    'navbar': {}
+}
+
+
+def child(n_records):
+    # runs in a fresh interpreter so every import is cold
+    sys.path.insert(0, REPO)
+    from benchmarks.synthetic import FakeClient, install_finance_stub
+
+    client = FakeClient(n_accounts=100, n_records=n_records)
+    install_finance_stub(client)
+
+    # third-party imports are the same for every size, keep them out of the timing
+    import dash_bootstrap_components, dash_core_components, dash_table, plotly.express
+
+    start = time.perf_counter()
+    import index
+    import_time = time.perf_counter() - start
+    import_calls = client.calls
+
+    from apps import analyze
+    start = time.perf_counter()
+    analyze.layout()
+    first_page_time = time.perf_counter() - start
+
+    print(json.dumps({
+        'import_time': import_time,
+        'import_calls': import_calls,
+        'first_page_time': first_page_time
+    }))
+
+
+def main(sizes=SIZES):
+    with tempfile.TemporaryDirectory() as workdir:
+        with open(os.path.join(workdir, 'config.yml'), 'w') as file:
+            yaml.dump(CONFIG, file)
+        with open(os.path.join(workdir, 'secrets.yml'), 'w') as file:
+            yaml.dump({'users': {}}, file)
+
+        print(f"{'records':>9} {'import (s)':>11} {'client calls':>13} {'first page (s)':>15}")
+
+        for n_records in sizes:
+            output = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.bench_startup', '--child', str(n_records)],
+                cwd=workdir,
+                env=dict(os.environ, PYTHONPATH=REPO),
+                capture_output=True,
+                text=True,
+                check=True
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+
+            print(f"{n_records:>9} {result['import_time']:>11.3f} {result['import_calls']:>13} {result['first_page_time']:>15.3f}")
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--child']:
+        child(int(sys.argv[2]))
+    else:
+        main()
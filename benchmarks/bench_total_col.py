@@ -0,0 +1,94 @@
+import sys
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import make_records
+from lib import create_total_col
+
+# (accounts, rows, days spanned); the last one has accounts updating on
+# different days over ten years, so the dense date x account matrix is mostly NaN
+SIZES = [
+    (10, 10_000, None),
+    (100, 10_000, None),
+    (100, 100_000, None),
+    (500, 100_000, None),
+    (500, 500_000, None),
+    (2000, 100_000, 3650),
+]
+
+
+def legacy_create_total_col(df, balance_col):
+    # the original per-account loop; df.append is gone from pandas, so the
+    # final step uses pd.concat
+    restructured_df = pd.DataFrame(index=df['date'].unique())
+
+    for account_id in df['account_id'].unique():
+        df_subset = df[df['account_id']==account_id][[balance_col,'date']].set_index('date')
+        restructured_df[account_id] = df_subset
+
+    restructured_df.sort_index(inplace=True)
+    restructured_df.interpolate(method='time', inplace=True)
+
+    restructured_df['total'] = restructured_df.sum(axis=1)
+    restructured_df['name_account'] = 'Total'
+    restructured_df['date'] = restructured_df.index
+    restructured_df.rename(columns={'total':balance_col}, inplace=True)
+
+    return pd.concat([df, restructured_df[['name_account', 'date', balance_col]]])
+
+
+def timed(func, *args, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def peak_memory(func, *args):
+    # MB allocated at the peak of one call
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 2**20
+
+
+def totals(df):
+    return df[df['name_account'] == 'Total'].sort_values('date')['balance'].values
+
+
+def main(sizes=SIZES):
+    warnings.simplefilter('ignore', pd.errors.PerformanceWarning)
+
+    print(
+        f"{'accounts':>8} {'rows':>9} {'legacy (s)':>11} {'sparse (s)':>11} {'speedup':>8} "
+        f"{'legacy (MB)':>12} {'sparse (MB)':>12}"
+    )
+
+    for n_accounts, n_rows, span_days in sizes:
+        # the legacy loop cannot handle duplicate dates, so compare on unique ones
+        df = make_records(n_accounts, n_rows, span_days=span_days).drop_duplicates(['account_id', 'date'])
+
+        legacy_time, legacy_df = timed(legacy_create_total_col, df, 'balance')
+        new_time, new_df = timed(create_total_col, df, 'balance')
+
+        if not np.allclose(totals(legacy_df), totals(new_df)):
+            sys.exit(f'Total mismatch for {n_accounts} accounts x {n_rows} rows')
+
+        legacy_memory = peak_memory(legacy_create_total_col, df, 'balance')
+        new_memory = peak_memory(create_total_col, df, 'balance')
+
+        print(
+            f'{n_accounts:>8} {n_rows:>9} {legacy_time:>11.3f} {new_time:>11.3f} {legacy_time / new_time:>7.1f}x '
+            f'{legacy_memory:>12.1f} {new_memory:>12.1f}'
+        )
+
+
+if __name__ == '__main__':
+    main()
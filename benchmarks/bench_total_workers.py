@@ -0,0 +1,47 @@
+import os
+import sys
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import make_records
+from totals import TotalBalance
+
+# (accounts, rows, days spanned)
+SIZES = [
+    (500, 500_000, 3650),
+    (2000, 2_000_000, 3650),
+    (5000, 5_000_000, 3650),
+]
+
+WORKERS = sorted({1, 2, 4, 8, os.cpu_count() or 1})
+
+
+def timed(func, *args, repeat=3, **kwargs):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main(sizes=SIZES, workers=WORKERS):
+    print(f'{os.cpu_count()} cores\n')
+    print(f"{'accounts':>8} {'rows':>9} {'workers':>8} {'seconds':>8} {'speedup':>8}")
+
+    for n_accounts, n_rows, span_days in sizes:
+        df = make_records(n_accounts, n_rows, span_days=span_days)
+
+        serial_time, serial = timed(TotalBalance.from_frame, df, 'balance')
+
+        for n_workers in workers:
+            seconds, total = timed(TotalBalance.from_frame, df, 'balance', workers=n_workers)
+            if not (np.array_equal(total.times, serial.times) and np.allclose(total.totals, serial.totals)):
+                sys.exit(f'Total mismatch with {n_workers} workers for {n_accounts} accounts x {n_rows} rows')
+
+            print(f'{n_accounts:>8} {n_rows:>9} {n_workers:>8} {seconds:>8.3f} {serial_time / seconds:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
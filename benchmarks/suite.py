@@ -0,0 +1,196 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import yaml
+
+from benchmarks.bench_startup import CONFIG, REPO
+from benchmarks.synthetic import AccountList, FakeClient, LabelList, install_finance_stub
+
+THRESHOLDS = os.path.join(REPO, 'benchmarks', 'thresholds.yml')
+
+
+def timed(func, repeat, setup=None):
+    # best of `repeat`, setup runs untimed before each call
+    best = float('inf')
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+### STAGES ###
+def stage_benchmarks(client):
+    # the lib/filters/rollups building blocks on the client's synthetic dataset
+    import pandas as pd
+    from filters import FilterIndex, LatestBalanceIndex
+    from lib import compact_records, compile_records, create_total_col, downsample
+    from rollups import RollupIndex
+
+    records = client.records.df
+    accounts = AccountList(client.accounts.df)
+    labels = LabelList(client.labels.df)
+
+    compiled_df = compile_records(None, records, accounts, labels)
+    compiled_df['date'] = pd.to_datetime(compiled_df['date'])
+    compiled_df = compact_records(compiled_df)
+
+    filter_index = FilterIndex(compiled_df)
+    account_ids = list(client.accounts.df['id'][:10])
+    total_df = create_total_col(compiled_df, 'balance')
+
+    return {
+        'compile_records': lambda: compile_records(None, records, accounts, labels),
+        'compact_records': lambda: compact_records(compiled_df),
+        'create_total_col': lambda: create_total_col(compiled_df, 'balance'),
+        'filter_index': lambda: FilterIndex(compiled_df),
+        'filter_mask': lambda: filter_index.mask(account_ids=account_ids, date_start='2016-01-01'),
+        'latest_balance_index': lambda: LatestBalanceIndex(compiled_df).latest(),
+        'rollup_index': lambda: RollupIndex(compiled_df),
+        'downsample': lambda: downsample(total_df, n_points=750),
+    }
+
+
+### CALLBACKS ###
+def callback_benchmarks(client):
+    # the analyze and explore callbacks with the app's caches cleared before
+    # every run, so each one does its full work
+    import flask
+
+    import data
+    import lib
+    from app import app
+    from apps import analyze, explore
+
+    key = data.compile_currency('USD')
+    account_ids = list(client.accounts.df['id'][:10])
+
+    def clear():
+        analyze.figure_cache.clear()
+        lib.total_balance_cache.clear()
+        data.table_frames.clear()
+
+    def render(graph_type, granularity='auto', line_group='account', **filters):
+        args = dict(account_ids=None, country_codes=None, label_ids=None, date_start=None, date_end=None) | filters
+        return lambda: analyze.render_graph(
+            graph_type, key, args['account_ids'], args['country_codes'], args['label_ids'],
+            args['date_start'], args['date_end'], 'USD', granularity, line_group, None, 750
+        )
+
+    def update_graph():
+        # submit and poll through the dash callbacks, like the browser does
+        with app.server.test_request_context():
+            flask.g.triggered_inputs = [{'prop_id': 'filter-button.n_clicks', 'value': 1}]
+            job_store = analyze.update_graph.__wrapped__(
+                1, None, None, None, None, None, None, None, 0, key, account_ids, None, None,
+                None, None, 'USD', 'auto', 'account', 1000, 'benchmark'
+            )
+        disabled = False
+        while not disabled:
+            with app.server.test_request_context():
+                flask.g.triggered_inputs = [{'prop_id': 'graph-job-store.data', 'value': job_store}]
+                figure, progress, disabled = analyze.poll_graph_job.__wrapped__(job_store, None)
+
+    return {
+        'render_plot': render('plot'),
+        'render_plot_records': render('plot', granularity='records'),
+        'render_plot_filtered': render('plot', account_ids=account_ids, date_start='2016-01-01'),
+        'render_plot_labels': render('plot', line_group='name_label'),
+        'render_tree': render('tree'),
+        'render_map': render('map'),
+        'update_graph': update_graph,
+        'render_table_page': lambda: explore.render_table_page(
+            'records', 3, 20, [{'column_id': 'balance', 'direction': 'desc'}], '{currency} eq "USD"'
+        ),
+    }, clear
+
+
+### REPORT ###
+def check(results, thresholds, baseline=None, tolerance=1.5):
+    failures = []
+
+    print(f"{'benchmark':<24} {'best (s)':>9} {'limit (s)':>10}  status")
+    for name, seconds in results.items():
+        limits = [thresholds.get(name)]
+        if baseline and name in baseline:
+            limits.append(baseline[name] * tolerance)
+        limits = [limit for limit in limits if limit is not None]
+        limit = min(limits) if limits else None
+
+        status = 'ok' if limit is None or seconds <= limit else 'REGRESSED'
+        if status != 'ok':
+            failures.append(name)
+
+        limit_text = f'{limit:>10.3f}' if limit is not None else f"{'-':>10}"
+        print(f'{name:<24} {seconds:>9.3f} {limit_text}  {status}')
+
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the app stages and callbacks on synthetic data.')
+    parser.add_argument('--records', type=int, default=100_000)
+    parser.add_argument('--accounts', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--only', nargs='+', help='benchmark names to run')
+    parser.add_argument('--thresholds', default=THRESHOLDS, help='yaml of absolute limits in seconds')
+    parser.add_argument('--baseline', help='json of earlier results, each may grow by --tolerance')
+    parser.add_argument('--tolerance', type=float, default=1.5)
+    parser.add_argument('--save', help='write the results as json, for use as a --baseline')
+    args = parser.parse_args()
+
+    paths = {name: os.path.abspath(path) for name, path in vars(args).items()
+             if name in ('thresholds', 'baseline', 'save') and path}
+    vars(args).update(paths)
+
+    client = FakeClient(n_accounts=args.accounts, n_records=args.records)
+    install_finance_stub(client)
+
+    # the app reads config.yml from the working directory
+    workdir = tempfile.mkdtemp()
+    with open(os.path.join(workdir, 'config.yml'), 'w') as file:
+        yaml.dump(CONFIG, file)
+    with open(os.path.join(workdir, 'secrets.yml'), 'w') as file:
+        yaml.dump({'users': {}}, file)
+    os.chdir(workdir)
+    sys.path.insert(0, REPO)
+
+    print(f'{args.records} records, {args.accounts} accounts, best of {args.repeat}\n')
+
+    stages = stage_benchmarks(client)
+    callbacks, clear = callback_benchmarks(client)
+
+    results = {}
+    for name, func in stages.items():
+        if not args.only or name in args.only:
+            results[name] = timed(func, args.repeat)
+    for name, func in callbacks.items():
+        if not args.only or name in args.only:
+            results[name] = timed(func, args.repeat, setup=clear)
+
+    with open(args.thresholds) as file:
+        thresholds = (yaml.load(file, Loader=yaml.FullLoader) or {}).get(args.records, {})
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+
+    failures = check(results, thresholds, baseline, args.tolerance)
+
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    if failures:
+        sys.exit(f"\n{len(failures)} benchmark(s) regressed: {', '.join(failures)}")
+
+
+if __name__ == '__main__':
+    main()
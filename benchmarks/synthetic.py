@@ -0,0 +1,184 @@
+import numpy as np
+import pandas as pd
+
+
+def make_records(n_accounts, n_rows, start='2015-01-01', seed=0, span_days=None):
+    # balance snapshots spread over random days, each account on its own schedule
+    rng = np.random.default_rng(seed)
+
+    account_ids = rng.integers(1, n_accounts + 1, size=n_rows)
+    days = rng.integers(0, span_days or max(n_rows // n_accounts, 1) * 3, size=n_rows)
+    dates = pd.Timestamp(start) + pd.to_timedelta(days, unit='D')
+    balances = np.round(rng.normal(10000, 2500, size=n_rows), 2)
+
+    return pd.DataFrame({
+        'id': np.arange(1, n_rows + 1),
+        'account_id': account_ids,
+        'balance': balances,
+        'currency': 'EUR',
+        'date': dates,
+        'name_account': ['Account ' + str(account_id) for account_id in account_ids]
+    })
+
+
+### LOCAL STAND-IN FOR THE FINANCE CLIENT ###
+CURRENCY_RATES = {'EUR': 1.0, 'USD': 1.1, 'NOK': 10.5}
+COUNTRY_CODES = ['NO', 'US', 'DE', 'SE', 'GB']
+
+
+def make_dataset(n_accounts, n_records, n_labels=5, seed=0):
+    rng = np.random.default_rng(seed)
+
+    labels = pd.DataFrame({
+        'id': np.arange(1, n_labels + 1),
+        'name': ['Label ' + str(i) for i in range(1, n_labels + 1)],
+        'description': ''
+    })
+
+    accounts = pd.DataFrame({
+        'id': np.arange(1, n_accounts + 1),
+        'name': ['Account ' + str(i) for i in range(1, n_accounts + 1)],
+        'description': '',
+        'label_id': rng.integers(1, n_labels + 1, size=n_accounts),
+        'country_code': rng.choice(COUNTRY_CODES, size=n_accounts)
+    })
+
+    records = make_records(n_accounts, n_records, seed=seed).drop(columns='name_account')
+    currencies = np.array(list(CURRENCY_RATES))
+    records['currency'] = currencies[records['account_id'].to_numpy() % len(currencies)]
+
+    return accounts, labels, records
+
+
+class _Item:
+
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+class Account(_Item):
+    pass
+
+
+class Label(_Item):
+    pass
+
+
+class Record(_Item):
+    pass
+
+
+class FrameList:
+
+    item_class = _Item
+
+    def __init__(self, df):
+        self.df = df
+
+    def __iter__(self):
+        return (self.item_class(**row) for row in self.df.to_dict('records'))
+
+    def __len__(self):
+        return len(self.df)
+
+    def to_pandas(self):
+        return self.df.copy()
+
+
+class RecordList(FrameList):
+
+    item_class = Record
+
+    def convert_currency(self, currency):
+        rates = self.df['currency'].map(CURRENCY_RATES).to_numpy()
+        converted = self.df.assign(
+            balance=self.df['balance'].to_numpy() / rates * CURRENCY_RATES[currency],
+            currency=currency
+        )
+        return RecordList(converted)
+
+
+class AccountList(FrameList):
+    item_class = Account
+
+
+class LabelList(FrameList):
+    item_class = Label
+
+
+class FrameAPI:
+
+    def __init__(self, client, list_class, df):
+        self.client = client
+        self.list_class = list_class
+        self.df = df
+
+    def list(self, **filters):
+        self.client.calls += 1
+        return self.list_class(self.df)
+
+    def create(self, items):
+        self.client.calls += 1
+        items = items if isinstance(items, (list, FrameList)) else [items]
+        rows = pd.DataFrame([vars(item) for item in items])
+        rows['id'] = np.arange(len(rows)) + (self.df['id'].max() if len(self.df) else 0) + 1
+        if 'date' in rows:
+            rows['date'] = pd.to_datetime(rows['date'])
+        self.df = pd.concat([self.df, rows], ignore_index=True)
+        return self.list_class(rows)
+
+
+class RecordAPI(FrameAPI):
+    # records.list with the filters and paging the app's query adapter pushes down
+
+    def list(self, account_ids=None, date_start=None, date_end=None, after_id=None, offset=None, limit=None):
+        self.client.calls += 1
+        df = self.df
+        if account_ids or date_start or date_end or after_id is not None:
+            mask = np.ones(len(df), dtype=bool)
+            if account_ids:
+                mask &= df['account_id'].isin(account_ids).to_numpy()
+            if date_start:
+                mask &= (df['date'] >= pd.Timestamp(date_start)).to_numpy()
+            if date_end:
+                mask &= (df['date'] <= pd.Timestamp(date_end)).to_numpy()
+            if after_id is not None:
+                mask &= (df['id'] > after_id).to_numpy()
+            df = df[mask]
+        if offset is not None or limit is not None:
+            start = offset or 0
+            df = df.iloc[start:start + limit if limit is not None else None]
+        return self.list_class(df.reset_index(drop=True))
+
+
+class FakeClient:
+
+    def __init__(self, n_accounts=50, n_records=10_000, n_labels=5, seed=0, **config):
+        accounts, labels, records = make_dataset(n_accounts, n_records, n_labels, seed)
+        self.calls = 0
+        self.accounts = FrameAPI(self, AccountList, accounts)
+        self.labels = FrameAPI(self, LabelList, labels)
+        self.records = RecordAPI(self, RecordList, records)
+        self._currency_codes = list(CURRENCY_RATES)
+        self._country_codes = COUNTRY_CODES
+
+
+def install_finance_stub(client):
+    # registers a 'finance.client' package whose Client returns `client`, so
+    # the app modules can be imported without the real finance package
+    import sys
+    import types
+
+    modules = {
+        'finance': {},
+        'finance.client': {'Client': lambda **config: client},
+        'finance.client.data_classes': {},
+        'finance.client.data_classes.accounts': {'Account': Account, 'AccountList': AccountList},
+        'finance.client.data_classes.labels': {'Label': Label, 'LabelList': LabelList},
+        'finance.client.data_classes.records': {'Record': Record, 'RecordList': RecordList},
+    }
+
+    for name, attributes in modules.items():
+        module = types.ModuleType(name)
+        module.__dict__.update(attributes)
+        sys.modules[name] = module
@@ -0,0 +1,156 @@
+import numpy as np
+import pandas as pd
+
+from cache import LRUCache
+from lib import append_records
+from metrics import span
+
+
+class CurrencyConverter:
+    # compiled_df holds the records in their own currencies. each target
+    # currency is converted through the finance client once, after that the
+    # converted balance column comes out of the LRU, aligned to compiled_df.
+    # the rates implied by those conversions are kept as a (date, currency)
+    # table so rows that arrive later can be converted with an as-of join.
+    # convert_records(currency) yields (id, balance) frames of the records
+    # converted by the client and is only called when a currency has to go
+    # through it; balances and rates can be seeded from a snapshot.
+
+    def __init__(self, convert_records, compiled_df, id_col='id_record', maxsize=4,
+                 balances=None, rates=None):
+        self.convert_records = convert_records
+        self.compiled_df = compiled_df
+        self.id_col = id_col
+        self.balances = LRUCache(maxsize=max(maxsize, len(balances or {})))
+        self.rates = pd.DataFrame({
+            'date': pd.Series(dtype='datetime64[ns]'),
+            'currency': pd.Series(dtype=object),
+            'to_currency': pd.Series(dtype=object),
+            'rate': pd.Series(dtype=float)
+        }) if rates is None else rates
+        self._materializing = set()
+
+        for currency, column in (balances or {}).items():
+            self.balances.put(currency, column)
+
+    def balance_column(self, currency):
+        balances = self.balances.get(currency)
+
+        if balances is None:
+            balances = self._materialize(currency)
+
+        return balances
+
+    def convert(self, currency):
+        # a Series isn't copied by assign, so a snapshot's mapped column stays mapped
+        balances = pd.Series(self.balance_column(currency), index=self.compiled_df.index, copy=False)
+        return self.compiled_df.assign(
+            balance=balances,
+            currency=pd.Categorical.from_codes(np.zeros(len(self.compiled_df), dtype=np.int8), [currency])
+        )
+
+    def _place(self, compiled_df, currency):
+        # each converted chunk is placed by id as it arrives. both sides are
+        # float64, the ids can have gaps, and an index of one dtype is hashed
+        # once instead of per chunk
+        ids = pd.Index(compiled_df[self.id_col].to_numpy(dtype=float))
+        balances = np.full(len(ids), np.nan)
+        with span('convert_currency'):
+            for converted in self.convert_records(currency):
+                positions = ids.get_indexer(converted['id'].to_numpy(dtype=float))
+                found = positions >= 0
+                balances[positions[found]] = converted['balance'].to_numpy(dtype=float)[found]
+
+        return balances
+
+    def _materialize(self, currency):
+        compiled_df = self.compiled_df
+        self._materializing.add(currency)
+        try:
+            balances = self._place(compiled_df, currency)
+            self._update_rates(compiled_df, currency, balances)
+
+            # rows appended after the records were listed aren't in the conversion
+            missing = np.isnan(balances) & compiled_df['balance'].notna().to_numpy()
+            if missing.any():
+                balances[missing] = self.convert_rows(compiled_df[missing], currency)
+
+            # nor are rows appended while converting
+            if len(self.compiled_df) > len(balances):
+                appended = self.convert_rows(self.compiled_df.iloc[len(balances):], currency)
+                balances = np.concatenate([balances, appended])
+        finally:
+            self._materializing.discard(currency)
+
+        return self.balances.put(currency, balances)
+
+    def append(self, compiled_rows):
+        # extends compiled_df and every cached currency column with new rows
+        for currency, balances in list(self.balances.items()):
+            converted = self.convert_rows(compiled_rows, currency)
+            self.balances.put(currency, np.concatenate([balances, converted]))
+
+        self.compiled_df = append_records(self.compiled_df, compiled_rows)
+
+    def _update_rates(self, compiled_df, currency, balances):
+        source_balances = compiled_df['balance'].to_numpy(dtype=float)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rate = balances / source_balances
+
+        # the first rate of each (date, currency), found by a stable sort of
+        # the dates and currency codes so only the unique rows get strings
+        rows = np.flatnonzero(np.isfinite(rate))
+        codes, currencies = pd.factorize(compiled_df['currency'])
+        dates = compiled_df['date'].to_numpy()
+        order = np.lexsort((codes[rows], dates[rows]))
+        sorted_dates, sorted_codes = dates[rows][order], codes[rows][order]
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = (sorted_dates[1:] != sorted_dates[:-1]) | (sorted_codes[1:] != sorted_codes[:-1])
+        rows = np.sort(rows[order[first]])
+
+        rates = pd.DataFrame({
+            'date': dates[rows],
+            'currency': np.asarray(currencies, dtype=object)[codes[rows]],
+            'to_currency': currency,
+            'rate': rate[rows]
+        })
+
+        self.rates = pd.concat(
+            [self.rates[self.rates['to_currency'] != currency], rates],
+            ignore_index=True
+        ).sort_values('date', ignore_index=True)
+
+    def lookup_rates(self, df, currency):
+        # latest known rate on or before each row's date for its currency,
+        # falling back to the nearest later one before the first known rate
+        if not (self.rates['to_currency'] == currency).any() and currency not in self._materializing:
+            self._materialize(currency)
+
+        result = np.full(len(df), np.nan)
+        rates = self.rates.loc[self.rates['to_currency'] == currency, ['date', 'currency', 'rate']]
+
+        # a conversion without a finite rate (no balances back, or only zero
+        # balances to divide by) leaves the rows it can't rate as NaN
+        if rates.empty:
+            result[df['currency'].to_numpy() == currency] = 1.0
+            return result
+
+        rates = rates.astype({'date': 'datetime64[ns]', 'currency': str})
+        rows = pd.DataFrame({
+            'date': pd.to_datetime(df['date']).to_numpy(),
+            'currency': df['currency'].to_numpy(),
+            'position': np.arange(len(df))
+        }).astype({'date': 'datetime64[ns]', 'currency': str}).sort_values('date')
+
+        backward = pd.merge_asof(rows, rates, on='date', by='currency', direction='backward')
+        nearest = pd.merge_asof(rows, rates, on='date', by='currency', direction='nearest')
+        rate = backward['rate'].fillna(nearest['rate']).to_numpy()
+
+        result[rows['position'].to_numpy()] = rate
+        result[df['currency'].to_numpy() == currency] = 1.0
+
+        return result
+
+    def convert_rows(self, df, currency):
+        return df['balance'].to_numpy(dtype=float) * self.lookup_rates(df, currency)
@@ -0,0 +1,476 @@
+import time
+from collections import deque
+from threading import RLock, Thread
+
+import numpy as np
+import pandas as pd
+import yaml
+from finance.client import Client
+
+from cache import LRUCache
+from currency import CurrencyConverter
+from filters import FilterIndex, LatestBalanceIndex
+from jobs import JobQueue
+from metrics import span
+import lib
+from lib import (compile_records, compact_records, create_total_balance, filter_table, sort_table,
+                 total_balance_cache)
+from pool import ClientPool
+from query import CHUNK_SIZE, RecordQuery, compile_chunks, convert_chunks, read_records
+from rollups import RollupIndex
+from snapshot import current_version, read_snapshot, write_snapshot
+
+with open('config.yml') as file:
+    config = yaml.load(file, Loader=yaml.FullLoader)
+
+### FINANCE CLIENT POOL ###
+# one pool per process, every query checks a client out for its duration
+client_pool = ClientPool(
+    factory=lambda: Client(**config['database']),
+    size=config['app'].get('client_pool_size', 4),
+    timeout=config['app'].get('client_pool_timeout', 30),
+    health_check=lambda client: client.labels.list()
+)
+
+checkout_client = client_pool.checkout
+
+### TOTALS ###
+# large totals are split across this many threads, see TotalBalance.from_frame
+lib.total_workers = config['app'].get('total_workers', 1)
+
+### BACKGROUND JOBS ###
+# slow callbacks submit their work here and poll for the result
+job_queue = JobQueue(
+    workers=config['app'].get('job_workers', 2),
+    ttl=config['app'].get('job_ttl', 600)
+)
+
+### RECORD QUERIES ###
+# records are fetched through query.py in chunks of this many rows
+QUERY_CHUNK_SIZE = config['app'].get('query_chunk_size', CHUNK_SIZE)
+
+### LAZY DATASET ###
+# nothing is fetched at import time. the first page or callback that needs a
+# piece of data loads it, and both pages share the same dataset.
+_loaded = {}
+_lock = RLock()
+
+def _lazy(name, loader):
+    if name not in _loaded:
+        with _lock:
+            if name not in _loaded:
+                _loaded[name] = loader()
+    return _loaded[name]
+
+def _list(api_name):
+    with checkout_client() as client, span(f'{api_name}.list'):
+        return getattr(client, api_name).list()
+
+def get_accounts():
+    return _lazy('accounts', lambda: _list('accounts'))
+
+def get_labels():
+    return _lazy('labels', lambda: _list('labels'))
+
+def get_currency_codes():
+    with checkout_client() as client:
+        return client._currency_codes
+
+def get_country_codes():
+    with checkout_client() as client:
+        return client._country_codes
+
+def _stream(query):
+    # the records of query, fetched in chunks and compiled as they arrive. the
+    # client is held across the pages, so accounts and labels are listed first.
+    get_accounts()
+    get_labels()
+
+    with checkout_client() as client, span('records.stream'):
+        return compile_chunks(client, query, _compile, chunk_size=QUERY_CHUNK_SIZE)
+
+def _convert(currency):
+    # the records converted by the client a chunk at a time, for the
+    # converter to place by id. no RecordList is kept.
+    with checkout_client() as client, span('records.convert'):
+        yield from convert_chunks(client, RecordQuery(), currency, chunk_size=QUERY_CHUNK_SIZE)
+
+def _compile(records_df):
+    # compile_records doesn't query, so no client is held while it runs
+    accounts = get_accounts()
+    labels = get_labels()
+
+    with span('compile_records'):
+        compiled_records_df = compile_records(
+            client=None,
+            records=records_df,
+            accounts=accounts,
+            labels=labels
+        )
+        if compiled_records_df['date'].dtype.kind != 'M':
+            compiled_records_df['date'] = pd.to_datetime(compiled_records_df['date'])
+
+        return compact_records(compiled_records_df)
+
+def _load_currency_converter():
+    converter = _load_snapshot()
+
+    if converter is None:
+        converter = CurrencyConverter(_convert, _stream(RecordQuery()))
+        if SNAPSHOT_DIR:
+            # only the default currency, the others are converted on demand
+            _snapshot['writer'] = Thread(target=write_dataset_snapshot, kwargs={'currencies': []}, daemon=True)
+            _snapshot['writer'].start()
+
+    return converter
+
+def get_currency_converter():
+    return _lazy('currency_converter', _load_currency_converter)
+
+def get_compiled_records():
+    return get_currency_converter().compiled_df
+
+### SNAPSHOTS ###
+# with app.snapshot_dir set, a cold process maps the last compiled dataset
+# (records, converted balances and rates) from disk and only compiles the
+# records added since. `python snapshot.py` refreshes it.
+SNAPSHOT_DIR = config['app'].get('snapshot_dir')
+SNAPSHOT_CHECK_INTERVAL = config['app'].get('snapshot_check_interval', 30)
+
+_snapshot = {'version': None, 'checked_at': 0.0, 'swapping': False, 'writer': None}
+
+def _load_snapshot():
+    snapshot = read_snapshot(SNAPSHOT_DIR) if SNAPSHOT_DIR else None
+
+    if snapshot is None:
+        return None
+
+    manifest, tables = snapshot
+    _snapshot['version'] = manifest['version']
+    converter = CurrencyConverter(
+        _convert,
+        tables['records'],
+        balances={currency: tables['balances'][currency].to_numpy() for currency in tables['balances'].columns},
+        rates=tables['rates']
+    )
+
+    # only the records added since, the id filter is pushed down if the client takes it
+    new_records_df = _stream(RecordQuery(after_id=manifest['meta']['high_water_mark']))
+    if new_records_df is not None:
+        converter.append(new_records_df.reindex(columns=converter.compiled_df.columns))
+
+    return converter
+
+def check_snapshot():
+    # at most every SNAPSHOT_CHECK_INTERVAL seconds, see whether CURRENT names
+    # a newer snapshot than the mapped one and swap to it in the background.
+    # requests keep the old dataset until the swap, its files stay readable
+    # after write_snapshot unlinks them.
+    now = time.monotonic()
+    if not SNAPSHOT_DIR or 'currency_converter' not in _loaded or now - _snapshot['checked_at'] < SNAPSHOT_CHECK_INTERVAL:
+        return
+    _snapshot['checked_at'] = now
+
+    version = current_version(SNAPSHOT_DIR)
+    if version is None or version == _snapshot['version'] or _snapshot['swapping']:
+        return
+
+    _snapshot['swapping'] = True
+    Thread(target=swap_snapshot, daemon=True).start()
+
+def swap_snapshot():
+    # the swap is a new data version whose rows aren't an append to the old
+    # ones, so the change log is cleared and every cache keyed on the old
+    # version resyncs
+    try:
+        with _lock:
+            converter = _load_snapshot()
+            if converter is None:
+                return
+            _loaded['currency_converter'] = converter
+            change_log.clear()
+            _data_version['version'] += 1
+    finally:
+        _snapshot['swapping'] = False
+
+def write_dataset_snapshot(currencies=None):
+    # the default currency, the given ones (all by default) and whatever the
+    # converter already holds. the columns are collected here, the
+    # converter's LRU only keeps a few.
+    converter = get_currency_converter()
+    if currencies is None:
+        currencies = get_currency_codes()
+
+    # converting can take a while, only the reads below need to be consistent
+    balances = {}
+    for currency in dict.fromkeys([config['app']['default_currency'], *currencies]):
+        balances[currency] = converter.balance_column(currency)
+
+    with _lock:
+        compiled_df = converter.compiled_df
+        balances.update(converter.balances.items())
+        # columns that dropped out of the LRU miss the rows appended since
+        for currency, column in balances.items():
+            if len(column) < len(compiled_df):
+                appended = converter.convert_rows(compiled_df.iloc[len(column):], currency)
+                balances[currency] = np.concatenate([column, appended])
+        balances = pd.DataFrame(balances)
+        rates = converter.rates
+
+    version = write_snapshot(
+        SNAPSHOT_DIR,
+        {'records': compiled_df, 'balances': balances, 'rates': rates},
+        meta={'high_water_mark': int(compiled_df['id_record'].max())}
+    )
+    # this process already holds what it wrote, there is nothing to swap to
+    _snapshot['version'] = version
+
+    return version
+
+### PRELOAD ###
+def preload(currency=None):
+    # everything the default Analyze view needs, built before a server forks
+    # its workers (see wsgi.py) so they share it copy-on-write. a snapshot
+    # written for a cold start is finished first, no thread may be running
+    # at the fork.
+    currency = currency or config['app']['default_currency']
+
+    get_accounts()
+    get_labels()
+    get_currency_converter()
+    if _snapshot['writer'] is not None:
+        _snapshot['writer'].join()
+
+    key = compile_currency(currency)
+    compiled_df = get_frame(key)
+    get_filter_index(key, compiled_df)
+    get_latest_balance_index(key, compiled_df)
+    get_rollup_index(key, compiled_df)
+    create_total_balance(compiled_df, 'balance', cache_key=key)
+
+    return key
+
+### DROPDOWN OPTIONS ###
+def account_options():
+    return [{'label':account.name, 'value':account.id} for account in get_accounts()]
+
+def label_options():
+    return [{'label':label.name, 'value':label.id} for label in get_labels()]
+
+def currency_options():
+    return [{'label': code, 'value':code} for code in get_currency_codes()]
+
+### COMPILED RECORDS CACHE ###
+# compiled frames stay in this process as typed numpy-backed columns, the
+# browser only holds the key. keys look like '<version>:<currency>', where the
+# version is bumped by every change to the dataset, so callbacks can tell a
+# stale key by comparing one integer and a worker that never saw a key can
+# still rebuild the frame it refers to.
+compiled_frames = LRUCache(maxsize=8)
+_data_version = {'version': 0}
+
+def data_version():
+    return _data_version['version']
+
+def frame_key(currency, version=None):
+    return f'{data_version() if version is None else version}:{currency}'
+
+def key_version(key):
+    return int(key.split(':', 1)[0])
+
+def key_currency(key):
+    return key.split(':', 1)[1]
+
+def put_frame(df, currency):
+    key = frame_key(currency)
+    compiled_frames.put(key, df)
+    return key
+
+def get_frame(key):
+    return compiled_frames.get(key)
+
+def compile_currency(currency):
+    key = frame_key(currency)
+
+    if key not in compiled_frames:
+        put_frame(get_currency_converter().convert(currency), currency)
+
+    return key
+
+def load_frame(key, currency):
+    # the current frame for a data-store key, rebuilt when the key is stale or
+    # this process doesn't have it
+    if key:
+        currency = key_currency(key)
+        if key_version(key) == data_version():
+            compiled_df = get_frame(key)
+            if compiled_df is not None:
+                return key, compiled_df
+
+    key = compile_currency(currency)
+
+    return key, get_frame(key)
+
+### CHANGE FEED ###
+# explore writes go through here after the client call succeeds, so analyze
+# sees them without reloading everything
+MAX_INCREMENTAL_ACCOUNTS = 10
+
+def records_created(records):
+    with _lock:
+        invalidate_table('records')
+
+        if 'currency_converter' not in _loaded or not records:
+            return
+
+        rows = pd.DataFrame({
+            'id': [getattr(record, 'id', None) for record in records],
+            'account_id': [record.account_id for record in records],
+            'balance': [float(record.balance) for record in records],
+            'currency': [record.currency for record in records],
+            'date': pd.to_datetime([record.date for record in records])
+        })
+        converter = get_currency_converter()
+        converter.append(_compile(rows).reindex(columns=converter.compiled_df.columns))
+
+        old_version = data_version()
+        _data_version['version'] += 1
+        change_log.append((data_version(), len(converter.compiled_df) - len(rows), len(converter.compiled_df)))
+
+        # carry cached totals forward, swapping in only the touched accounts'
+        # curves. a large import is cheaper to total from scratch.
+        account_ids = rows['account_id'].unique()
+        if len(account_ids) > MAX_INCREMENTAL_ACCOUNTS:
+            return
+
+        for key, compiled_df in compiled_frames.items():
+            if key_version(key) != old_version:
+                continue
+            total = total_balance_cache.get((key, 'balance'))
+            if total is None:
+                continue
+            new_key = compile_currency(key_currency(key))
+            for account_id in account_ids:
+                total = total.update(compiled_df, get_frame(new_key), account_id, 'balance')
+            total_balance_cache.put((new_key, 'balance'), total)
+
+### CHANGE LOG ###
+# the compiled records only ever grow at the end: every version the change
+# feed makes is logged with the row range it appended. state built for an
+# older version catches up from those rows instead of being rebuilt, as long
+# as the log still reaches back to that version. past that, it resyncs.
+CHANGE_LOG_SIZE = 64
+change_log = deque(maxlen=CHANGE_LOG_SIZE)
+
+def changes_since(version):
+    # (start, stop) row ranges appended after version, or None for a resync
+    if version == data_version():
+        return []
+    if version > data_version() or not change_log or change_log[0][0] > version + 1:
+        return None
+
+    return [(start, stop) for logged, start, stop in change_log if logged > version]
+
+def created_records(result, records):
+    # what records.create returned: the stored records with their ids, as one
+    # record or a list of them. the records sent stand in if it returned nothing.
+    if result is None:
+        return list(records)
+    if hasattr(result, 'account_id'):
+        return [result]
+    return list(result)
+
+def record_created(record):
+    records_created([record])
+
+def account_created(account):
+    with _lock:
+        invalidate_table('accounts')
+        _loaded.pop('accounts', None)
+
+def label_created(label):
+    with _lock:
+        invalidate_table('labels')
+        _loaded.pop('labels', None)
+
+### ROW INDEXES ###
+# every currency's frame of one data version shares the row order of the
+# compiled records, so the indexes are built once per version
+filter_indexes = LRUCache(maxsize=4)
+latest_balance_indexes = LRUCache(maxsize=4)
+rollup_indexes = LRUCache(maxsize=4)
+
+def _get_index(cache, index_class, key, df):
+    version = key_version(key)
+    index = cache.get(version)
+
+    if index is None:
+        index = _catch_up(cache, df)
+        if index is None:
+            index = index_class(df)
+        index = cache.put(version, index)
+
+    return index
+
+def _catch_up(cache, df):
+    # the newest cached index of an older version, extended by the rows
+    # appended since, for the index classes that can be extended
+    for version, index in sorted(cache.items(), key=lambda item: item[0], reverse=True):
+        if not hasattr(index, 'extend') or changes_since(version) is None:
+            continue
+        if index.size <= len(df):
+            return index.extend(df)
+
+    return None
+
+def get_filter_index(key, df):
+    return _get_index(filter_indexes, FilterIndex, key, df)
+
+def get_latest_balance_index(key, df):
+    return _get_index(latest_balance_indexes, LatestBalanceIndex, key, df)
+
+def get_rollup_index(key, df):
+    return _get_index(rollup_indexes, RollupIndex, key, df)
+
+### EXPLORE TABLES ###
+# the explore table pages through these frames, keyed by data type and a
+# per-type version that creating an item bumps
+TABLE_TYPES = ('accounts', 'records', 'labels')
+
+table_frames = LRUCache(maxsize=16)
+_table_versions = dict.fromkeys(TABLE_TYPES, 0)
+
+def get_table_frame(data_type):
+    key = (data_type, _table_versions[data_type])
+    frame = table_frames.get(key)
+
+    if frame is None:
+        frame = table_frames.put(key, _list(data_type).to_pandas())
+
+    return frame
+
+def query_table(data_type, filter_query=None, sort_by=None):
+    sort_key = tuple((col['column_id'], col['direction']) for col in sort_by or [])
+    key = (data_type, _table_versions[data_type], filter_query or '', sort_key)
+    frame = table_frames.get(key)
+
+    if frame is None:
+        frame = sort_table(filter_table(_table_source(data_type, filter_query), filter_query), sort_by)
+        frame = table_frames.put(key, frame.reset_index(drop=True))
+
+    return frame
+
+def _table_source(data_type, filter_query):
+    # a records filter the client can narrow down is fetched on its own,
+    # unless the whole table is cached anyway
+    if data_type == 'records' and (data_type, _table_versions[data_type]) not in table_frames:
+        query = RecordQuery.from_filter_query(filter_query)
+        with checkout_client() as client:
+            if query.pushdown(client.records.list):
+                with span('records.query'):
+                    return read_records(client, query, chunk_size=QUERY_CHUNK_SIZE)
+
+    return get_table_frame(data_type)
+
+def invalidate_table(data_type):
+    _table_versions[data_type] += 1
@@ -0,0 +1,154 @@
+import numpy as np
+import pandas as pd
+
+FILTER_COLUMNS = ('account_id', 'country_code', 'label_id')
+
+
+class FilterIndex:
+    # built once per compiled frame: factorized codes for the dropdown
+    # columns and a date-sorted permutation for the date range
+
+    def __init__(self, df):
+        self.size = len(df)
+        self.codes = {}
+        self.uniques = {}
+
+        for col in FILTER_COLUMNS:
+            codes, uniques = pd.factorize(df[col])
+            self.codes[col] = codes
+            self.uniques[col] = pd.Index(uniques)
+
+        dates = df['date'].to_numpy(dtype='datetime64[ns]')
+        self.date_order = np.argsort(dates, kind='stable')
+        self.sorted_dates = dates[self.date_order]
+
+    def extend(self, df):
+        # a copy covering df, whose first self.size rows are the ones indexed.
+        # new values get the next codes and the new dates are merged into the
+        # sorted ones, nothing is factorized or sorted again.
+        index = FilterIndex.__new__(FilterIndex)
+        index.size = len(df)
+        index.codes = {}
+        index.uniques = {}
+        rows = df.iloc[self.size:]
+
+        for col in FILTER_COLUMNS:
+            values = rows[col].astype(object)
+            uniques = self.uniques[col]
+            codes = uniques.get_indexer(values)
+
+            unseen = (codes == -1) & values.notna().to_numpy()
+            if unseen.any():
+                uniques = uniques.astype(object).append(pd.Index(values[unseen].unique(), dtype=object))
+                codes[unseen] = uniques.get_indexer(values[unseen])
+
+            index.codes[col] = np.concatenate([self.codes[col], codes])
+            index.uniques[col] = uniques
+
+        dates = rows['date'].to_numpy(dtype='datetime64[ns]')
+        order = np.argsort(dates, kind='stable')
+        slots = self.sorted_dates.searchsorted(dates[order], side='right')
+        index.sorted_dates = np.insert(self.sorted_dates, slots, dates[order])
+        index.date_order = np.insert(self.date_order, slots, np.arange(self.size, len(df))[order])
+
+        return index
+
+    def mask(self, account_ids=None, country_codes=None, label_ids=None,
+             date_start=None, date_end=None):
+
+        mask = np.ones(self.size, dtype=bool)
+
+        for col, values in zip(FILTER_COLUMNS, (account_ids, country_codes, label_ids)):
+            if values:
+                # one slot per code plus a trailing False for missing values (code -1)
+                lookup = np.zeros(len(self.uniques[col]) + 1, dtype=bool)
+                positions = self.uniques[col].get_indexer(values)
+                lookup[positions[positions >= 0]] = True
+                mask &= lookup[self.codes[col]]
+
+        if date_start or date_end:
+            start = 0
+            end = self.size
+            if date_start:
+                start = self.sorted_dates.searchsorted(np.datetime64(pd.Timestamp(date_start), 'ns'), side='right')
+            if date_end:
+                end = self.sorted_dates.searchsorted(np.datetime64(pd.Timestamp(date_end), 'ns'), side='left')
+
+            in_range = np.zeros(self.size, dtype=bool)
+            in_range[self.date_order[start:end]] = True
+            mask &= in_range
+
+        return mask
+
+
+class LatestBalanceIndex:
+    # rows sorted by (account, date) with each account's rows contiguous, so
+    # "latest row before a date" is one searchsorted per account
+
+    def __init__(self, df):
+        self.size = len(df)
+        account_codes, self.accounts = pd.factorize(df['account_id'])
+        dates = df['date'].to_numpy(dtype='datetime64[ns]')
+        self.unique_dates, date_ranks = np.unique(dates, return_inverse=True)
+
+        self.order = np.lexsort((date_ranks, account_codes))
+        self.keys = account_codes[self.order].astype(np.int64) * len(self.unique_dates) + date_ranks[self.order]
+        self.sorted_dates = dates[self.order]
+        self._set_bounds()
+
+    def _set_bounds(self):
+        codes = np.arange(len(self.accounts), dtype=np.int64)
+        self.starts = np.searchsorted(self.keys, codes * len(self.unique_dates), side='left')
+        self.ends = np.searchsorted(self.keys, (codes + 1) * len(self.unique_dates), side='left')
+
+    def extend(self, df):
+        # a copy covering df, whose first self.size rows are the ones indexed.
+        # new dates only shift the date ranks inside the keys, so the old keys
+        # are renumbered in place and the new rows merged in, nothing is sorted again.
+        if not self.size:
+            return LatestBalanceIndex(df)
+
+        index = LatestBalanceIndex.__new__(LatestBalanceIndex)
+        index.size = len(df)
+        rows = df.iloc[self.size:]
+
+        values = rows['account_id']
+        accounts = self.accounts
+        account_codes = accounts.get_indexer(values)
+        unseen = (account_codes == -1) & values.notna().to_numpy()
+        if unseen.any():
+            accounts = accounts.append(pd.Index(values[unseen].unique()))
+            account_codes[unseen] = accounts.get_indexer(values[unseen])
+        index.accounts = accounts
+
+        dates = rows['date'].to_numpy(dtype='datetime64[ns]')
+        index.unique_dates = np.union1d(self.unique_dates, dates)
+        n_dates = len(index.unique_dates)
+        old_dates = len(self.unique_dates)
+        ranks = index.unique_dates.searchsorted(self.unique_dates)
+        keys = (self.keys // old_dates) * n_dates + ranks[self.keys % old_dates]
+
+        new_keys = account_codes.astype(np.int64) * n_dates + index.unique_dates.searchsorted(dates)
+        order = np.argsort(new_keys, kind='stable')
+        slots = keys.searchsorted(new_keys[order], side='right')
+        index.keys = np.insert(keys, slots, new_keys[order])
+        index.order = np.insert(self.order, slots, np.arange(self.size, len(df))[order])
+        index.sorted_dates = np.insert(self.sorted_dates, slots, dates[order])
+        index._set_bounds()
+
+        return index
+
+    def latest(self, date_start=None, date_end=None):
+        # positions of each account's most recent row inside (date_start, date_end)
+        ends = self.ends
+        if date_end:
+            end_rank = self.unique_dates.searchsorted(np.datetime64(pd.Timestamp(date_end), 'ns'), side='left')
+            codes = np.arange(len(self.accounts), dtype=np.int64)
+            ends = np.searchsorted(self.keys, codes * len(self.unique_dates) + end_rank, side='left')
+
+        last = ends - 1
+        valid = last >= self.starts
+        if date_start:
+            valid[valid] = self.sorted_dates[last[valid]] > np.datetime64(pd.Timestamp(date_start), 'ns')
+
+        return self.order[last[valid]]
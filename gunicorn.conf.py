@@ -0,0 +1,26 @@
+import yaml
+
+with open('config.yml') as file:
+    config = yaml.load(file, Loader=yaml.FullLoader)
+
+bind = f"{config['app']['host']}:{config['app']['port']}"
+
+# one process by default. background jobs, created records and the data
+# version live in a worker's memory: another worker polling a job draws the
+# graph again itself and doesn't see records created elsewhere. more workers
+# only suit read-only dashboards fed by snapshots.
+workers = config['app'].get('workers', 1)
+
+# threads per worker, a graph job keeps running while its progress is polled
+worker_class = 'gthread'
+threads = config['app'].get('threads', 8)
+
+# wsgi.py loads the dataset in the master, the workers inherit it at fork
+preload_app = True
+timeout = 120
+
+
+def post_fork(server, worker):
+    # the master's finance client connections stay with the master
+    from data import client_pool
+    client_pool.after_fork()
@@ -0,0 +1,199 @@
+import argparse
+import re
+import time
+
+import pandas as pd
+from finance.client.data_classes.records import Record
+
+from data import checkout_client, created_records, get_accounts, get_currency_codes, get_table_frame, records_created
+
+RECORD_COLUMNS = ['account_id', 'balance', 'currency', 'date']
+OFX_EXTENSIONS = ('.ofx', '.qfx')
+
+# whether the finance client's records.create takes a list of records,
+# learned from the first batch it is given
+_batch_create = {'supported': None}
+
+### READERS ###
+def read_csv_chunks(file, chunk_size=10000, account_id=None, currency=None):
+    # account_id/currency fill in columns a bank export doesn't have
+    for chunk in pd.read_csv(file, chunksize=chunk_size):
+        chunk.columns = [col.strip().lower() for col in chunk.columns]
+        if account_id is not None:
+            chunk['account_id'] = account_id
+        if currency is not None:
+            chunk['currency'] = currency
+        yield chunk.reindex(columns=RECORD_COLUMNS)
+
+def _ofx_values(text, tag):
+    return re.findall(rf'<{tag}>\s*([^<\r\n]+)', text, flags=re.IGNORECASE)
+
+def read_ofx_chunks(file, chunk_size=10000, account_id=None, currency=None):
+    # OFX carries transactions plus one ledger balance; the end-of-day balance
+    # for each posting date is the ledger balance minus everything posted later
+    if account_id is None:
+        raise ValueError('OFX files have no account ids, pick the account to import into')
+
+    text = file.read()
+    if isinstance(text, bytes):
+        text = text.decode('utf-8', errors='replace')
+
+    ledger = re.search(r'<LEDGERBAL>(.*?)(</LEDGERBAL>|$)', text, flags=re.IGNORECASE | re.DOTALL)
+    if ledger is None:
+        raise ValueError('OFX file has no ledger balance (LEDGERBAL) to derive balances from')
+    ledger = ledger.group(1)
+    ledger_balance = float(_ofx_values(ledger, 'BALAMT')[0])
+    ledger_date = pd.to_datetime(_ofx_values(ledger, 'DTASOF')[0][:8], format='%Y%m%d')
+    currency = currency or (_ofx_values(text, 'CURDEF') or [None])[0]
+
+    transactions = pd.DataFrame({
+        'date': pd.to_datetime([value[:8] for value in _ofx_values(text, 'DTPOSTED')], format='%Y%m%d'),
+        'amount': pd.to_numeric(_ofx_values(text, 'TRNAMT'))
+    })
+    daily = transactions.groupby('date')['amount'].sum()
+    daily = daily[daily.index <= ledger_date].sort_index()
+
+    if ledger_date not in daily.index:
+        daily.loc[ledger_date] = 0.0
+
+    posted_later = daily[::-1].cumsum()[::-1].shift(-1, fill_value=0.0)
+
+    records = pd.DataFrame({
+        'account_id': account_id,
+        'balance': (ledger_balance - posted_later).values,
+        'currency': currency,
+        'date': daily.index
+    })
+
+    for start in range(0, len(records), chunk_size):
+        yield records.iloc[start:start + chunk_size]
+
+def read_chunks(file, filename, **kwargs):
+    if filename.lower().endswith(OFX_EXTENSIONS):
+        return read_ofx_chunks(file, **kwargs)
+    return read_csv_chunks(file, **kwargs)
+
+### VALIDATION ###
+def validate_chunk(chunk, account_ids, currency_codes):
+    chunk = chunk.assign(
+        account_id=pd.to_numeric(chunk['account_id'], errors='coerce'),
+        balance=pd.to_numeric(chunk['balance'], errors='coerce'),
+        currency=chunk['currency'].astype(str).str.strip().str.upper(),
+        date=pd.to_datetime(chunk['date'], errors='coerce')
+    )
+
+    valid = (
+        chunk['account_id'].isin(account_ids)
+        & chunk['currency'].isin(currency_codes)
+        & chunk['balance'].notna()
+        & chunk['date'].notna()
+    )
+
+    return chunk[valid].astype({'account_id': int}), int((~valid).sum())
+
+def record_keys(df):
+    return pd.MultiIndex.from_arrays([df['account_id'].astype(int), pd.to_datetime(df['date'])])
+
+### IMPORT ###
+def create_records(client, records):
+    # one call for the batch where the client takes a list, else one per
+    # record. a client that only takes single records fails on the list
+    # before storing anything, and is sent single records from then on.
+    if _batch_create['supported'] is not False:
+        try:
+            created = created_records(client.records.create(records), records)
+        except (TypeError, AttributeError):
+            if _batch_create['supported']:
+                raise
+            _batch_create['supported'] = False
+        else:
+            _batch_create['supported'] = True
+            return created
+
+    created = []
+    for record in records:
+        created += created_records(client.records.create(record), [record])
+    return created
+
+def import_records(file, filename, account_id=None, currency=None, chunk_size=10000, batch_size=1000):
+    start = time.perf_counter()
+
+    account_ids = [account.id for account in get_accounts()]
+    currency_codes = get_currency_codes()
+    seen = record_keys(get_table_frame('records'))
+
+    report = {'inserted': 0, 'duplicates': 0, 'invalid': 0}
+    batch = []
+    created = []
+
+    def flush():
+        with checkout_client() as client:
+            created.extend(create_records(client, batch))
+        report['inserted'] += len(batch)
+        batch.clear()
+
+    # the whole import reaches the change feed as one append and one new data
+    # version, also what was stored before a failure
+    try:
+        for chunk in read_chunks(file, filename, chunk_size=chunk_size, account_id=account_id, currency=currency):
+            chunk, invalid = validate_chunk(chunk, account_ids, currency_codes)
+            report['invalid'] += invalid
+
+            # skip (account_id, date) pairs already stored or earlier in this file
+            keys = record_keys(chunk)
+            duplicate = keys.isin(seen) | keys.duplicated(keep='first')
+            report['duplicates'] += int(duplicate.sum())
+            chunk = chunk[~duplicate]
+            seen = seen.append(keys[~duplicate])
+
+            for row in chunk.itertuples(index=False):
+                batch.append(Record(
+                    account_id=row.account_id,
+                    currency=row.currency,
+                    balance=row.balance,
+                    date=row.date
+                ))
+                if len(batch) >= batch_size:
+                    flush()
+
+        if batch:
+            flush()
+    finally:
+        if created:
+            records_created(created)
+
+    report['seconds'] = time.perf_counter() - start
+    report['rows_per_second'] = report['inserted'] / report['seconds'] if report['seconds'] else 0.0
+
+    return report
+
+def format_report(report):
+    return (
+        f"Imported {report['inserted']} records in {report['seconds']:.1f}s "
+        f"({report['rows_per_second']:.0f} rows/s), skipped {report['duplicates']} duplicates "
+        f"and {report['invalid']} invalid rows"
+    )
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Bulk import balance records from CSV or OFX files.')
+    parser.add_argument('files', nargs='+')
+    parser.add_argument('--account-id', type=int, help='account for files without an account_id column (required for OFX)')
+    parser.add_argument('--currency', help='currency for files without a currency column')
+    parser.add_argument('--chunk-size', type=int, default=10000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    if args.account_id is None and any(filename.lower().endswith(OFX_EXTENSIONS) for filename in args.files):
+        parser.error('--account-id is required for OFX files')
+
+    for filename in args.files:
+        with open(filename, 'rb') as file:
+            report = import_records(
+                file,
+                filename,
+                account_id=args.account_id,
+                currency=args.currency,
+                chunk_size=args.chunk_size,
+                batch_size=args.batch_size
+            )
+        print(f'{filename}: {format_report(report)}')
@@ -2,8 +2,11 @@ import dash_bootstrap_components as dbc
 import dash_html_components as html
 import dash_core_components as dcc
 import yaml
+from flask import Response, abort, jsonify, request
 from dash.dependencies import State, Input, Output
 from app import app
+import metrics
+from data import check_snapshot, client_pool, job_queue
 from apps import test_app, explore, analyze
 
 with open('config.yml') as file:
@@ -50,15 +53,58 @@ app.layout = html.Div([
 )
 def display_page(pathname):
     
+    # the pages build their layouts here, on load, so nothing is fetched
+    # when they are imported
     if pathname == '/explore':
-        return explore.layout
+        return explore.layout()
     elif pathname == '/test':
         return test_app.layout
     elif pathname == '/analyze':
-        return analyze.layout
+        return analyze.layout()
     else:
         return '404'
         
 
+# picks up snapshots refreshed by `python snapshot.py` while the server runs
+@app.server.before_request
+def check_snapshot_version():
+    check_snapshot()
+
+
+@app.server.route('/health')
+def health():
+    return jsonify({
+        'client_pool': client_pool.stats(),
+        'figure_cache': analyze.figure_cache.stats(),
+        'jobs': job_queue.stats()
+    })
+
+
+@app.server.route('/metrics')
+def metrics_endpoint():
+    text = metrics.render({
+        'client_pool': client_pool.stats(),
+        'figure_cache': analyze.figure_cache.stats(),
+        'jobs': job_queue.stats()
+    })
+    return Response(text, mimetype='text/plain; version=0.0.4')
+
+
+# /profile?name=render_graph profiles the next run of that callback or stage,
+# only when app.profiling is set
+metrics.profile_dir = config['app'].get('profile_dir', metrics.profile_dir)
+
+@app.server.route('/profile')
+def profile():
+    if not config['app'].get('profiling'):
+        abort(404)
+    
+    name = request.args.get('name')
+    if name:
+        metrics.arm(name)
+    
+    return jsonify({'armed': name, 'profile_dir': metrics.profile_dir, 'profiles': metrics.profiles()})
+
+
 if __name__ == "__main__":
     app.run_server(debug=True, port=config['app']['port'], host=config['app']['host'])
\ No newline at end of file
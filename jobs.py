@@ -0,0 +1,162 @@
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+from threading import Event, RLock, local
+
+from cache import LRUCache
+
+# seconds a poll waits on a job that was just submitted, so quick (e.g.
+# cached) results come back with the first request
+JOB_WAIT = 0.2
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+
+    def __init__(self, session, name):
+        self.id = uuid.uuid4().hex
+        self.session = session
+        self.name = name
+        self.state = 'pending'
+        self.progress = 0.0
+        self.message = 'Queued'
+        self.result = None
+        self.error = None
+        self.future = None
+        self.cancelled = Event()
+
+    def status(self):
+        return {'state': self.state, 'progress': self.progress, 'message': self.message}
+
+
+_current = local()
+
+def new_session():
+    # one id per page view, a newer job of the same name from that view
+    # cancels the older one
+    return uuid.uuid4().hex
+
+
+def report_progress(progress, message=''):
+    # called from inside a job, a no-op anywhere else. a job that has been
+    # superseded stops at its next report.
+    job = getattr(_current, 'job', None)
+
+    if job is None:
+        return
+    if job.cancelled.is_set():
+        raise JobCancelled(job.id)
+
+    job.progress = progress
+    job.message = message
+
+
+class JobQueue:
+    # slow callback work runs on `workers` threads instead of the request
+    # thread, so at most that many heavy jobs run at once and the rest queue.
+    # each session has one live job per name: submitting a new one cancels
+    # the previous job, before it starts or at its next report_progress.
+    # threads rather than processes, the jobs work on this process's dataset.
+
+    def __init__(self, workers=2, keep=256, ttl=600):
+        self.workers = workers
+        self.jobs = LRUCache(maxsize=keep, ttl=ttl)
+        self.latest = LRUCache(maxsize=keep, ttl=ttl)
+
+        self._executor = None
+        self._lock = RLock()
+        self._stats = {'submitted': 0, 'done': 0, 'cancelled': 0, 'failed': 0}
+
+    def _get_executor(self):
+        # created on first use, a forked worker must not inherit the threads
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='job')
+        return self._executor
+
+    def submit(self, session, name, func, *args):
+        # returns a job store for the browser
+        job = Job(session, name)
+
+        with self._lock:
+            previous = self.latest.get((session, name))
+            if previous is not None:
+                self.cancel(previous.id)
+            self.latest.put((session, name), job)
+            self.jobs.put(job.id, job)
+            self._stats['submitted'] += 1
+            job.future = self._get_executor().submit(self._run, job, func, args)
+
+        return {'job': job.id, 'args': list(args)}
+
+    def _run(self, job, func, args):
+        if job.cancelled.is_set():
+            self._finish(job, 'cancelled')
+            return
+
+        job.state = 'running'
+        _current.job = job
+
+        try:
+            job.result = func(*args)
+            job.progress = 1.0
+            self._finish(job, 'done')
+        except JobCancelled:
+            self._finish(job, 'cancelled')
+        except Exception as error:
+            job.error = error
+            job.message = str(error)
+            self._finish(job, 'failed')
+        finally:
+            _current.job = None
+
+    def _finish(self, job, state):
+        job.state = state
+        with self._lock:
+            self._stats[state] += 1
+
+    def cancel(self, job_id):
+        job = self.jobs.get(job_id)
+
+        if job is not None and job.state in ('pending', 'running'):
+            job.cancelled.set()
+            if job.future is not None and job.future.cancel():
+                self._finish(job, 'cancelled')
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def wait(self, job_id, timeout):
+        # lets a poll return a quick job's result in the same round trip
+        job = self.jobs.get(job_id)
+
+        if job is not None and job.future is not None:
+            wait([job.future], timeout=timeout)
+
+        return job
+
+    def poll(self, store, func, timeout=0):
+        # the job behind a job store ({'job': id, 'args': [...]}). a process
+        # that never saw the job, another worker or after it expired, runs it
+        # inline from the stored arguments
+        job = self.wait(store['job'], timeout)
+
+        if job is None:
+            job = Job(None, None)
+            self._run(job, func, store['args'])
+
+        return job
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+
+        states = [job.state for key, job in self.jobs.items()]
+        stats.update(
+            workers=self.workers,
+            pending=states.count('pending'),
+            running=states.count('running')
+        )
+
+        return stats
@@ -1,40 +1,326 @@
+import re
+
+import numpy as np
 import pandas as pd
+from cache import LRUCache
+from totals import TotalBalance
+
+total_balance_cache = LRUCache(maxsize=8)
+
+# threads a total is computed on, app.total_workers in config.yml
+total_workers = 1
+
+def create_total_balance(df, balance_col, cache_key=None):
+    if cache_key is not None:
+        total = total_balance_cache.get((cache_key, balance_col))
+        if total is not None:
+            return total
+
+    total = TotalBalance.from_frame(df, balance_col, workers=total_workers)
+
+    if cache_key is not None:
+        total_balance_cache.put((cache_key, balance_col), total)
+
+    return total
+
+def create_total_rows(df, balance_col, cache_key=None, name='Total'):
+    total = create_total_balance(df, balance_col, cache_key=cache_key)
+    dates = pd.DatetimeIndex(total.dates())
+
+    return pd.DataFrame({
+        'name_account': name,
+        'date': dates,
+        balance_col: total.totals
+    }, index=dates)
+
+def create_total_col(df, balance_col, cache_key=None):
+    return pd.concat([df, create_total_rows(df, balance_col, cache_key=cache_key)])
+
+def create_group_totals(df, balance_col, group_col, cache_key=None):
+    # one line per value of group_col summed like the Total line, which is
+    # added after them. rows without a value only count towards the Total.
+    lines = [
+        create_total_rows(rows, balance_col, name=str(name))
+        for name, rows in df.groupby(group_col, observed=True, sort=True)
+    ]
+    return pd.concat(lines + [create_total_rows(df, balance_col, cache_key=cache_key)])
+
+### DOWNSAMPLING ###
+def lttb(x, y, n_out):
+    # largest-triangle-three-buckets: keeps the first and last point and, per
+    # bucket, the point spanning the largest triangle with its neighbours
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    selected = np.empty(n_out, dtype=int)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    previous = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        next_x = x[end:next_end].mean()
+        next_y = y[end:next_end].mean()
+
+        area = np.abs(
+            (x[previous] - next_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (next_y - y[previous])
+        )
+        previous = start + int(np.nanargmax(area)) if np.isfinite(area).any() else start
+        selected[i + 1] = previous
+
+    return selected
+
+def minmax_downsample(x, y, n_out):
+    # the lowest and highest point of each of n_out/2 equal-width x buckets
+    n = len(x)
+    if n_out >= n or n < 3:
+        return np.arange(n)
+
+    n_buckets = max(n_out // 2, 1)
+    span = x[-1] - x[0]
+    buckets = np.zeros(n, dtype=int) if span == 0 else ((x - x[0]) / span * n_buckets).astype(int)
+    buckets = np.minimum(buckets, n_buckets - 1)
+
+    order = np.lexsort((y, buckets))
+    sorted_buckets = buckets[order]
+    starts = np.flatnonzero(np.r_[True, sorted_buckets[1:] != sorted_buckets[:-1]])
+    ends = np.r_[starts[1:], n] - 1
+
+    return np.unique(np.r_[order[starts], order[ends], 0, n - 1])
+
+DOWNSAMPLERS = {'lttb': lttb, 'minmax': minmax_downsample}
+
+# the fewest points a series is cut to: its ends and its extremes
+MIN_SERIES_POINTS = 4
+
+def downsample(df, n_points, x_col='date', y_col='balance', group_col='name_account',
+               x_range=None, method='minmax'):
+    # per series: keep the points inside x_range (plus one on each side so the
+    # lines run to the edges) and reduce them to its share of about n_points
+    # for the whole figure
+    downsampler = DOWNSAMPLERS[method]
+    df = df.sort_values([group_col, x_col], kind='stable')
+
+    x_all = df[x_col].to_numpy(dtype='datetime64[ns]').astype(np.int64).astype(float)
+    y_all = df[y_col].to_numpy(dtype=float)
+    groups = df[group_col].to_numpy()
+    bounds = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1], True])
+    series_points = max(n_points // max(len(bounds) - 1, 1), MIN_SERIES_POINTS)
+
+    if x_range:
+        range_start, range_end = (float(pd.Timestamp(value).value) for value in x_range)
+
+    keep = []
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        x = x_all[start:end]
+        if x_range:
+            first = max(np.searchsorted(x, range_start, side='left') - 1, 0)
+            last = min(np.searchsorted(x, range_end, side='right') + 1, len(x))
+        else:
+            first, last = 0, len(x)
+        keep.append(start + first + downsampler(x[first:last], y_all[start + first:start + last], series_points))
+
+    return df.iloc[np.concatenate(keep)] if keep else df
 
-def create_total_col(df, balance_col):
-    restructured_df = pd.DataFrame(index=df['date'].unique())
+### COMPACT RECORDS ###
+def _is_id_column(name):
+    return name == 'id' or name.startswith('id_') or name.endswith('_id')
 
-    for account_id in df['account_id'].unique():
-        df_subset = df[df['account_id']==account_id][[balance_col,'date']].set_index('date')    
-        restructured_df[account_id] = df_subset
+def compact_records(df):
+    # repeated strings (names, descriptions, codes) become categoricals so each
+    # row holds a small code and the text is only looked up when rendering.
+    # integer ids shrink to 32 bits, ids that picked up NaN from a left join
+    # stay float64 (float32 only holds integers exactly up to 2**24).
+    # balances stay float64, float32 drops cents on balances above ~167k.
+    columns = {}
 
-    restructured_df.sort_index(inplace=True)
-    restructured_df.interpolate(method='time', inplace=True)
+    for name, col in df.items():
+        if isinstance(col.dtype, pd.CategoricalDtype) or col.dtype.kind == 'M':
+            columns[name] = col
+        elif col.dtype.kind in 'iu' and _is_id_column(name) and (col.empty or col.abs().max() < 2**31):
+            columns[name] = col.astype(np.int32)
+        elif col.dtype.kind in 'biuf':
+            columns[name] = col
+        else:
+            columns[name] = col.astype('category')
 
-    restructured_df['total'] = restructured_df.sum(axis=1)
-    restructured_df['name_account'] = 'Total'
-    restructured_df['date'] = restructured_df.index
-    restructured_df.rename(columns={'total':balance_col}, inplace=True)
-    
-    df = df.append(restructured_df[['name_account', 'date', balance_col]])
-    
-    return df
+    return pd.DataFrame(columns, index=df.index)
+
+def append_records(df, rows):
+    # concat that keeps df's compact dtypes, growing categories for new values
+    rows = rows.reindex(columns=df.columns)
+
+    for name, dtype in df.dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype):
+            missing = pd.Index(rows[name].dropna().unique()).difference(dtype.categories)
+            if len(missing):
+                df = df.assign(**{name: df[name].cat.add_categories(missing)})
+            rows[name] = pd.Categorical(rows[name], categories=df[name].cat.categories)
+        else:
+            try:
+                rows[name] = rows[name].astype(dtype)
+            except (TypeError, ValueError):
+                # e.g. records created without an id, the column widens to float
+                if dtype.kind in 'iuf':
+                    rows[name] = pd.to_numeric(rows[name], errors='coerce')
+
+    return pd.concat([df, rows], ignore_index=True)
+
+def concat_records(frames):
+    # concat of compact frames, one column at a time with each categorical
+    # recoded to the union of the categories. None for no frames.
+    frames = list(frames)
+    if not frames:
+        return None
+
+    columns = {}
+    for name, dtype in frames[0].dtypes.items():
+        pieces = [frame[name] for frame in frames]
+        if isinstance(dtype, pd.CategoricalDtype):
+            pieces = [piece.astype('category') for piece in pieces]
+            categories = dtype.categories
+            for piece in pieces[1:]:
+                categories = categories.append(piece.cat.categories.difference(categories))
+            pieces = [piece.cat.set_categories(categories) for piece in pieces]
+
+        # ids of a chunk without missing ones are int32 and widen to the
+        # float64 of a chunk with some
+        columns[name] = pd.concat(pieces, ignore_index=True)
+
+    return pd.DataFrame(columns, copy=False)
+
+def _take(col, positions, fill):
+    # one value per fact row. string columns are taken as categoricals so only
+    # the codes are repeated
+    if col.dtype.kind not in 'biufM':
+        return col.astype('category').array.take(positions, allow_fill=fill)
+    return pd.api.extensions.take(col.to_numpy(), positions, allow_fill=fill)
+
+def join_dimension(df, dimension, left_on, right_on='id', suffixes=('_x', '_y')):
+    # left join of a fact frame on a small dimension frame with unique keys.
+    # the dimension is indexed once and its columns are taken positionally,
+    # names shared by both sides get suffixes like DataFrame.merge.
+    positions = pd.Index(dimension[right_on]).get_indexer(df[left_on])
+    fill = bool((positions == -1).any())
+    overlap = set(df.columns) & set(dimension.columns)
+
+    columns = {}
+    for name, col in df.items():
+        columns[name + suffixes[0] if name in overlap else name] = col.array
+    for name, col in dimension.items():
+        columns[name + suffixes[1] if name in overlap else name] = _take(col, positions, fill)
+
+    return pd.DataFrame(columns, index=pd.RangeIndex(len(df)), copy=False)
 
 def compile_records(client, records, accounts, labels):
 
-    compiled_df = records.merge(
-        accounts.to_pandas(), 
-        how='left', 
-        left_on='account_id', 
-        right_on='id', 
+    compiled_df = join_dimension(
+        records,
+        accounts.to_pandas(),
+        left_on='account_id',
         suffixes=('_record', '_account')
     )
 
-    compiled_df = compiled_df.merge(
-        labels.to_pandas(), 
-        how='left', 
-        left_on='label_id', 
-        right_on='id', 
+    compiled_df = join_dimension(
+        compiled_df,
+        labels.to_pandas(),
+        left_on='label_id',
         suffixes=('_account', '_label')
     )
-    
-    return compiled_df
\ No newline at end of file
+
+    return compiled_df
+
+### TABLE QUERIES ###
+# DataTable filter_query operators by name, each with its symbol if it has one
+TABLE_FILTER_OPERATORS = [
+    ['ge', '>='],
+    ['le', '<='],
+    ['lt', '<'],
+    ['gt', '>'],
+    ['ne', '!='],
+    ['eq', '='],
+    ['contains'],
+    ['datestartswith']
+]
+TABLE_FILTER_OPERATOR_NAMES = {
+    operator: operator_type[0] for operator_type in TABLE_FILTER_OPERATORS for operator in operator_type
+}
+TABLE_FILTER_PART = re.compile(r'\s*\{(?P<name>[^}]*)\}\s*(?P<operator>\S+)\s*(?P<value>.*)', re.DOTALL)
+
+def split_filter_part(filter_part):
+    # '{column} operator value', the operator being the token right after the
+    # column so an operator's name inside a value doesn't count
+    match = TABLE_FILTER_PART.fullmatch(filter_part)
+    if not match or match['operator'] not in TABLE_FILTER_OPERATOR_NAMES:
+        return None, None, None
+
+    value_part = match['value'].strip()
+    quote = value_part[:1]
+    if len(value_part) > 1 and quote == value_part[-1] and quote in ("'", '"', '`'):
+        value = value_part[1:-1].replace('\\' + quote, quote)
+    else:
+        try:
+            value = float(value_part)
+        except ValueError:
+            value = value_part
+
+    return match['name'], TABLE_FILTER_OPERATOR_NAMES[match['operator']], value
+
+def filter_value(col, value):
+    # value as the type of col for a comparison, None when it isn't one
+    if col.dtype.kind in 'biuf':
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
+    if col.dtype.kind == 'M':
+        value = pd.to_datetime(str(value), errors='coerce')
+        return None if pd.isna(value) else value
+    if isinstance(value, float):
+        return str(int(value)) if value.is_integer() else str(value)
+    return value
+
+def filter_table(df, filter_query):
+    # parts that don't parse, or whose value doesn't fit the column, are skipped
+    if not filter_query:
+        return df
+
+    mask = pd.Series(True, index=df.index)
+
+    for filter_part in filter_query.split(' && '):
+        col_name, operator, value = split_filter_part(filter_part)
+
+        if col_name not in df.columns:
+            continue
+
+        col = df[col_name]
+        if operator in ('eq', 'ne', 'lt', 'le', 'gt', 'ge'):
+            value = filter_value(col, value)
+            if value is None:
+                continue
+            if operator in ('lt', 'le', 'gt', 'ge') and col.dtype.kind not in 'biufM':
+                # strings are ordered as text, categoricals don't order at all
+                col = col.astype(str)
+            mask &= getattr(col, operator)(value)
+        elif operator == 'contains':
+            mask &= col.astype(str).str.contains(str(value), regex=False)
+        elif operator == 'datestartswith':
+            mask &= col.astype(str).str.startswith(str(value))
+
+    return df[mask]
+
+def sort_table(df, sort_by):
+    sort_by = [col for col in sort_by or [] if col['column_id'] in df.columns]
+
+    if not sort_by:
+        return df
+
+    return df.sort_values(
+        [col['column_id'] for col in sort_by],
+        ascending=[col['direction'] == 'asc' for col in sort_by],
+        kind='stable'
+    )
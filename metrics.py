@@ -0,0 +1,155 @@
+import cProfile
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from functools import wraps
+from threading import Lock, local
+
+# seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+PREFIX = 'finance_app'
+
+
+class Histogram:
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            i = len(self.buckets)
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+_histograms = {}
+_lock = Lock()
+
+def observe(metric, value, **labels):
+    key = (metric, tuple(sorted(labels.items())))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram()
+        histogram.observe(value)
+
+### SPANS ###
+# callbacks are wrapped in timed(), the stages inside them in span(). a span
+# is labelled with the callback running on its thread, so the same stage
+# (e.g. convert_currency) is told apart per callback.
+_current = local()
+
+def _callback():
+    return getattr(_current, 'callback', None) or 'none'
+
+@contextmanager
+def span(stage):
+    start = time.perf_counter()
+    with _profiled(stage):
+        try:
+            yield
+        finally:
+            observe('stage_seconds', time.perf_counter() - start, callback=_callback(), stage=stage)
+
+def timed(callback):
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            outer = getattr(_current, 'callback', None)
+            _current.callback = callback
+            start = time.perf_counter()
+            try:
+                with _profiled(callback):
+                    return func(*args, **kwargs)
+            finally:
+                observe('callback_seconds', time.perf_counter() - start, callback=callback)
+                _current.callback = outer
+        return wrapper
+    return decorator
+
+### PROFILING ###
+# arm(name) profiles the next callback or span called name and dumps the
+# cProfile stats to profile_dir, for `python -m pstats` or snakeviz
+profile_dir = os.path.join(tempfile.gettempdir(), 'finance-app-profiles')
+_armed = set()
+_profiles = []
+
+def arm(name):
+    with _lock:
+        _armed.add(name)
+
+def profiles():
+    return list(_profiles)
+
+@contextmanager
+def _profiled(name):
+    with _lock:
+        armed = name in _armed
+        _armed.discard(name)
+
+    if not armed:
+        yield
+        return
+
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        os.makedirs(profile_dir, exist_ok=True)
+        path = os.path.join(profile_dir, f'{name}-{time.time_ns()}.prof')
+        profile.dump_stats(path)
+        _profiles.append(path)
+        del _profiles[:-20]
+
+### EXPORT ###
+def _format_labels(labels):
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels) + '}' if labels else ''
+
+def render(gauges=None):
+    # prometheus text format. gauges maps a source name to a stats() dict,
+    # its numeric values become PREFIX_<source>_<stat>
+    lines = []
+
+    with _lock:
+        histograms = sorted(
+            (metric, labels, list(histogram.counts), histogram.sum, histogram.count, histogram.buckets)
+            for (metric, labels), histogram in _histograms.items()
+        )
+
+    typed = set()
+    for metric, labels, counts, total, count, buckets in histograms:
+        name = f'{PREFIX}_{metric}'
+        if name not in typed:
+            lines.append(f'# TYPE {name} histogram')
+            typed.add(name)
+
+        cumulative = 0
+        for bound, bucket_count in zip(buckets + ('+Inf',), counts):
+            cumulative += bucket_count
+            lines.append(f'{name}_bucket{_format_labels(labels + (("le", bound),))} {cumulative}')
+        lines.append(f'{name}_sum{_format_labels(labels)} {total}')
+        lines.append(f'{name}_count{_format_labels(labels)} {count}')
+
+    for source, stats in (gauges or {}).items():
+        for stat, value in stats.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                name = f'{PREFIX}_{source}_{stat}'
+                lines.append(f'# TYPE {name} gauge')
+                lines.append(f'{name} {value}')
+
+    return '\n'.join(lines) + '\n'
+
+def reset():
+    with _lock:
+        _histograms.clear()
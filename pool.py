@@ -0,0 +1,104 @@
+import queue
+import time
+from contextlib import contextmanager
+from threading import BoundedSemaphore, Lock
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ClientPool:
+    # at most `size` clients exist, and each is used by one request at a time.
+    # clients are created on demand, reused most-recently-returned first, and
+    # health checked when they have sat idle longer than health_check_interval.
+
+    def __init__(self, factory, size=4, timeout=30, health_check=None, health_check_interval=60):
+        self.factory = factory
+        self.size = size
+        self.timeout = timeout
+        self.health_check = health_check
+        self.health_check_interval = health_check_interval
+
+        self._slots = BoundedSemaphore(size)
+        self._idle = queue.LifoQueue()
+        self._lock = Lock()
+        self._stats = {
+            'created': 0,
+            'discarded': 0,
+            'checkouts': 0,
+            'in_use': 0,
+            'waits': 0,
+            'wait_seconds': 0.0,
+            'timeouts': 0
+        }
+
+    @contextmanager
+    def checkout(self):
+        start = time.perf_counter()
+
+        if not self._slots.acquire(blocking=False):
+            self._count('waits')
+            if not self._slots.acquire(timeout=self.timeout):
+                self._count('timeouts')
+                raise PoolTimeout(f'No finance client available after {self.timeout}s')
+
+        try:
+            client = self._get()
+        except Exception:
+            self._slots.release()
+            raise
+
+        self._count('wait_seconds', time.perf_counter() - start)
+        self._count('checkouts')
+        self._count('in_use')
+
+        try:
+            yield client
+        finally:
+            self._idle.put((client, time.monotonic()))
+            self._count('in_use', -1)
+            self._slots.release()
+
+    def after_fork(self):
+        # a forked worker must not use the connections its parent opened, it
+        # starts with an empty pool and its own locks
+        self._slots = BoundedSemaphore(self.size)
+        self._idle = queue.LifoQueue()
+        self._lock = Lock()
+        self._stats = dict.fromkeys(self._stats, 0)
+
+    def _get(self):
+        while True:
+            try:
+                client, returned_at = self._idle.get_nowait()
+            except queue.Empty:
+                client = self.factory()
+                self._count('created')
+                return client
+
+            if time.monotonic() - returned_at < self.health_check_interval or self._healthy(client):
+                return client
+
+            self._count('discarded')
+
+    def _healthy(self, client):
+        if self.health_check is None:
+            return True
+        try:
+            self.health_check(client)
+            return True
+        except Exception:
+            return False
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self._stats[name] += value
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['size'] = self.size
+        stats['idle'] = self._idle.qsize()
+        stats['open'] = stats['created'] - stats['discarded']
+        return stats
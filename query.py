@@ -0,0 +1,144 @@
+import inspect
+
+import numpy as np
+import pandas as pd
+
+from lib import concat_records, split_filter_part
+
+RECORD_FIELDS = ('id', 'account_id', 'balance', 'currency', 'date')
+CHUNK_SIZE = 100_000
+
+
+class RecordQuery:
+    # a subset of the records: some accounts, an inclusive date range and/or
+    # the records after an id. filters on labels or countries reach records
+    # as the account ids they select.
+
+    def __init__(self, account_ids=None, date_start=None, date_end=None, after_id=None):
+        self.account_ids = list(account_ids) if account_ids else None
+        self.date_start = date_start
+        self.date_end = date_end
+        self.after_id = after_id
+
+    @classmethod
+    def from_filter_query(cls, filter_query):
+        # the parts of a DataTable filter_query a records query can narrow
+        # down to. the rows it returns still go through filter_table.
+        # values that don't parse are left to filter_table.
+        query = cls()
+        for filter_part in (filter_query or '').split(' && '):
+            name, operator, value = split_filter_part(filter_part)
+            if name in ('account_id', 'id'):
+                value = pd.to_numeric(value, errors='coerce')
+                if pd.isna(value) or value != int(value):
+                    continue
+                if name == 'account_id' and operator == 'eq':
+                    query.account_ids = [int(value)]
+                elif name == 'id' and operator in ('gt', 'ge'):
+                    query.after_id = int(value) - (operator == 'ge')
+            elif name == 'date' and not pd.isna(pd.to_datetime(str(value), errors='coerce')):
+                if operator in ('gt', 'ge'):
+                    query.date_start = str(value)
+                elif operator in ('lt', 'le'):
+                    query.date_end = str(value)
+        return query
+
+    def filters(self):
+        filters = {
+            'account_ids': self.account_ids,
+            'date_start': self.date_start,
+            'date_end': self.date_end,
+            'after_id': self.after_id
+        }
+        return {name: value for name, value in filters.items() if value is not None}
+
+    def pushdown(self, list_func):
+        # the filters records.list takes as keyword arguments. its signature
+        # is all the adapter knows about the client, whatever it doesn't take
+        # is only applied to the chunks.
+        parameters = inspect.signature(list_func).parameters
+        return {name: value for name, value in self.filters().items() if name in parameters}
+
+    def mask(self, df):
+        mask = np.ones(len(df), dtype=bool)
+        if self.account_ids:
+            mask &= df['account_id'].isin(self.account_ids).to_numpy()
+        if self.date_start or self.date_end:
+            dates = pd.to_datetime(df['date'])
+            if self.date_start:
+                mask &= (dates >= pd.Timestamp(self.date_start)).to_numpy()
+            if self.date_end:
+                mask &= (dates <= pd.Timestamp(self.date_end)).to_numpy()
+        if self.after_id is not None:
+            mask &= (df['id'] > self.after_id).to_numpy()
+        return mask
+
+
+### CHUNKS ###
+def _pages(list_func, filters, chunk_size):
+    # offset/limit paging, one RecordList per chunk
+    offset = 0
+    while True:
+        page = list_func(**filters, offset=offset, limit=chunk_size)
+        if len(page):
+            yield page
+        if len(page) < chunk_size:
+            return
+        offset += chunk_size
+
+def _pages_supported(list_func):
+    parameters = inspect.signature(list_func).parameters
+    return 'offset' in parameters and 'limit' in parameters
+
+def _record_lists(list_func, filters, chunk_size):
+    # the pages, or for a client without paging its one whole list
+    if _pages_supported(list_func):
+        yield from _pages(list_func, filters, chunk_size)
+    else:
+        yield list_func(**filters)
+
+def _batches(records, chunk_size):
+    # a client without paging returns the whole list. it goes through
+    # to_pandas like the pages, so both paths give the same columns, and on
+    # in slices of chunk_size rows.
+    df = records.to_pandas()
+    for start in range(0, len(df), chunk_size):
+        yield df.iloc[start:start + chunk_size]
+
+def fetch_chunks(client, query, chunk_size=CHUNK_SIZE):
+    list_func = client.records.list
+    filters = query.pushdown(list_func)
+
+    if _pages_supported(list_func):
+        chunks = (page.to_pandas() for page in _pages(list_func, filters, chunk_size))
+    else:
+        chunks = _batches(list_func(**filters), chunk_size)
+
+    for chunk in chunks:
+        chunk = chunk[query.mask(chunk)]
+        if len(chunk):
+            yield chunk
+
+def read_records(client, query, chunk_size=CHUNK_SIZE):
+    # the raw records of query as one frame
+    chunks = list(fetch_chunks(client, query, chunk_size))
+    if not chunks:
+        return pd.DataFrame(columns=list(RECORD_FIELDS))
+    return pd.concat(chunks, ignore_index=True)
+
+def compile_chunks(client, query, compile, chunk_size=CHUNK_SIZE):
+    # every chunk is compiled and compacted on arrival, so only one chunk of
+    # raw rows is held at a time next to the compact frames. None when the
+    # query matches nothing.
+    return concat_records(compile(chunk) for chunk in fetch_chunks(client, query, chunk_size))
+
+def convert_chunks(client, query, currency, chunk_size=CHUNK_SIZE):
+    # (id, balance) frames of query's records converted to currency by the
+    # client, a page at a time. a client without paging converts its whole
+    # list at once. no list is kept after its frame is taken.
+    list_func = client.records.list
+    filters = query.pushdown(list_func)
+
+    for records in _record_lists(list_func, filters, chunk_size):
+        converted = records.convert_currency(currency=currency).to_pandas()
+        yield converted[['id', 'balance']]
@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+
+# coarsest first, with the length of a period in days
+ROLLUP_FREQUENCIES = {'M': 31, 'W': 7, 'D': 1}
+ROLLUP_LABELS = {'D': 'Daily', 'W': 'Weekly', 'M': 'Monthly'}
+
+# 'auto' plots monthly from three years on screen, weekly from eight months
+# and daily from five weeks, the records below that
+AUTO_MIN_PERIODS = 36
+
+
+def period_codes(dates, freq):
+    # integer period per datetime64[ns] date. weeks start on monday,
+    # 1970-01-01 was a thursday
+    if freq == 'M':
+        return dates.astype('datetime64[M]').astype(np.int64)
+
+    days = dates.astype('datetime64[D]').astype(np.int64)
+    if freq == 'W':
+        return (days + 3) // 7
+    return days
+
+
+def _last_per_group(accounts, periods, dates, positions):
+    # of each (account, period) group the row with the latest date, the
+    # later row winning ties like drop_duplicates(keep='last')
+    order = np.lexsort((positions, dates, periods, accounts))
+    accounts, periods = accounts[order], periods[order]
+    last = np.r_[(accounts[1:] != accounts[:-1]) | (periods[1:] != periods[:-1]), True]
+
+    return order[last]
+
+
+class RollupIndex:
+    # per frequency, the rows holding each account's last balance of every
+    # day, week and month. the rows are positions into the compiled records,
+    # so every currency's frame of one data version shares them, and they are
+    # real records: interpolating and totalling them works as on the full
+    # frame. rows appended to the frame are folded in by extend().
+
+    def __init__(self, df, frequencies=tuple(ROLLUP_FREQUENCIES)):
+        self.size = 0
+        self.groups = {
+            freq: {name: np.empty(0, dtype=np.int64) for name in ('account', 'period', 'date', 'position')}
+            for freq in frequencies
+        }
+        self._add(df, 0)
+
+    def _add(self, df, start):
+        rows = df.iloc[start:]
+        accounts = rows['account_id'].to_numpy(dtype=np.int64)
+        dates = rows['date'].to_numpy(dtype='datetime64[ns]')
+        positions = np.arange(start, len(df), dtype=np.int64)
+
+        for freq, groups in self.groups.items():
+            new = {
+                'account': accounts,
+                'period': period_codes(dates, freq),
+                'date': dates.astype(np.int64),
+                'position': positions
+            }
+            merged = {name: np.concatenate([groups[name], new[name]]) for name in groups}
+            keep = _last_per_group(merged['account'], merged['period'], merged['date'], merged['position'])
+            self.groups[freq] = {name: values[keep] for name, values in merged.items()}
+
+        self.size = len(df)
+
+    def extend(self, df):
+        # a copy covering df, whose first self.size rows are the ones indexed
+        rollup = RollupIndex.__new__(RollupIndex)
+        rollup.size = self.size
+        rollup.groups = dict(self.groups)
+        rollup._add(df, self.size)
+
+        return rollup
+
+    def positions(self, freq):
+        return np.sort(self.groups[freq]['position'])
+
+    def choose(self, granularity, date_start, date_end):
+        # the rollup to plot from: the requested one, or for 'auto' the
+        # coarsest one with at least AUTO_MIN_PERIODS periods in the visible
+        # range. None means the raw records.
+        if granularity in self.groups:
+            return granularity
+        if granularity != 'auto' or date_start is None or date_end is None:
+            return None
+
+        days = (pd.Timestamp(date_end) - pd.Timestamp(date_start)).days
+        for freq, period_days in ROLLUP_FREQUENCIES.items():
+            if freq in self.groups and days / period_days >= AUTO_MIN_PERIODS:
+                return freq
+
+        return None
@@ -0,0 +1,94 @@
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+
+CURRENT = 'CURRENT'
+MANIFEST = 'manifest.json'
+
+# a snapshot is a directory of one .npy file per column plus a manifest.
+# numeric and datetime columns are stored as-is, everything else as
+# categorical codes with the categories in the manifest, so every column can
+# be memory-mapped and all workers on a host read the same pages.
+# CURRENT names the live snapshot and is swapped atomically.
+
+def _column_array(col):
+    if col.dtype.kind == 'M':
+        return 'array', col.to_numpy(dtype='datetime64[ns]'), None
+    if col.dtype.kind in 'biuf':
+        return 'array', col.to_numpy(), None
+
+    categorical = pd.Categorical(col)
+    return 'categorical', categorical.codes, categorical.categories.tolist()
+
+def write_snapshot(directory, tables, meta=None, keep=2):
+    version = str(time.time_ns())
+    path = os.path.join(directory, version)
+    tmp_path = path + '.tmp'
+    os.makedirs(tmp_path, exist_ok=True)
+
+    manifest = {'version': version, 'meta': meta or {}, 'tables': {}}
+
+    for table_name, df in tables.items():
+        columns = []
+        for i, (name, col) in enumerate(df.items()):
+            kind, values, categories = _column_array(col)
+            file = f'{table_name}.{i}.npy'
+            np.save(os.path.join(tmp_path, file), np.ascontiguousarray(values))
+            columns.append({'name': name, 'file': file, 'kind': kind, 'categories': categories})
+        manifest['tables'][table_name] = {'rows': len(df), 'columns': columns}
+
+    with open(os.path.join(tmp_path, MANIFEST), 'w') as file:
+        json.dump(manifest, file, default=str)
+
+    os.rename(tmp_path, path)
+
+    pointer = os.path.join(directory, CURRENT)
+    with open(pointer + '.tmp', 'w') as file:
+        file.write(version)
+    os.replace(pointer + '.tmp', pointer)
+
+    # unlinking is safe for workers that still have older versions mapped
+    versions = sorted(name for name in os.listdir(directory) if name.isdigit())
+    for old_version in versions[:-keep]:
+        shutil.rmtree(os.path.join(directory, old_version), ignore_errors=True)
+
+    return version
+
+def current_version(directory):
+    try:
+        with open(os.path.join(directory, CURRENT)) as file:
+            return file.read().strip()
+    except FileNotFoundError:
+        return None
+
+def read_snapshot(directory, version=None):
+    version = version or current_version(directory)
+    if version is None:
+        return None
+
+    path = os.path.join(directory, version)
+    with open(os.path.join(path, MANIFEST)) as file:
+        manifest = json.load(file)
+
+    tables = {}
+    for table_name, table in manifest['tables'].items():
+        arrays = {}
+        for column in table['columns']:
+            values = np.load(os.path.join(path, column['file']), mmap_mode='r')
+            if column['kind'] == 'categorical':
+                values = pd.Categorical.from_codes(values, categories=column['categories'])
+            arrays[column['name']] = values
+        tables[table_name] = pd.DataFrame(arrays, copy=False)
+
+    return manifest, tables
+
+if __name__ == '__main__':
+    from data import write_dataset_snapshot
+
+    start = time.perf_counter()
+    version = write_dataset_snapshot()
+    print(f'Wrote snapshot {version} in {time.perf_counter() - start:.1f}s')
@@ -0,0 +1,32 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+import yaml
+
+# the app modules live at the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def app_modules(tmp_path_factory):
+    # the app imported once against a synthetic client, from a directory
+    # holding the config files the modules read at import
+    from benchmarks.bench_startup import CONFIG
+    from benchmarks.synthetic import FakeClient, install_finance_stub
+
+    workdir = tmp_path_factory.mktemp('app')
+    with open(workdir / 'config.yml', 'w') as file:
+        yaml.dump(CONFIG, file)
+    with open(workdir / 'secrets.yml', 'w') as file:
+        yaml.dump({'users': {}}, file)
+    os.chdir(workdir)
+
+    client = FakeClient(n_accounts=10, n_records=2000)
+    install_finance_stub(client)
+
+    import data
+    from apps import analyze, explore
+
+    return SimpleNamespace(client=client, data=data, analyze=analyze, explore=explore)
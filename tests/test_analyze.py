@@ -0,0 +1,43 @@
+import pytest
+from dash.exceptions import PreventUpdate
+
+
+def find(component, component_id):
+    if getattr(component, 'id', None) == component_id:
+        return component
+    children = getattr(component, 'children', None)
+    for child in children if isinstance(children, list) else [children]:
+        if child is not None and not isinstance(child, str):
+            found = find(child, component_id)
+            if found is not None:
+                return found
+    return None
+
+
+def test_page_loaded_after_a_data_change(app_modules):
+    from benchmarks.synthetic import Record
+
+    data, analyze = app_modules.data, app_modules.analyze
+    data.get_compiled_records()
+    data.records_created([Record(id=10_001, account_id=1, currency='EUR', balance=1.0, date='2030-01-01')])
+
+    seen_version = find(analyze.layout(), 'data-version-store').data
+    with pytest.raises(PreventUpdate):
+        analyze.check_data_version.__wrapped__(1, seen_version)
+
+    data.records_created([Record(id=10_002, account_id=1, currency='EUR', balance=2.0, date='2030-02-01')])
+    assert analyze.check_data_version.__wrapped__(1, seen_version) == analyze.process_data_version()
+
+
+def test_page_loads_do_not_share_components(app_modules):
+    analyze, explore = app_modules.analyze, app_modules.explore
+
+    first, second = analyze.layout(), analyze.layout()
+    for component_id in ('account-dropdown', 'currency-dropdown', 'data-version-store', 'data-store'):
+        assert find(first, component_id) is not find(second, component_id)
+    assert find(first, 'account-dropdown').options
+
+    first, second = explore.layout(), explore.layout()
+    for component_id in ('create-record-account-dropdown', 'create-account-label-dropdown', 'session-store'):
+        assert find(first, component_id) is not find(second, component_id)
+    assert find(first, 'create-record-currency-dropdown').options
@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import CURRENCY_RATES, RecordList
+from currency import CurrencyConverter
+from lib import compact_records
+
+
+def make_converter():
+    records = pd.DataFrame({
+        'id': [1, 2, 3, 4],
+        'account_id': [1, 1, 2, 2],
+        'balance': [100.0, 110.0, 1050.0, 2100.0],
+        'currency': ['EUR', 'EUR', 'NOK', 'NOK'],
+        'date': pd.to_datetime(['2020-01-01', '2020-02-01', '2020-01-01', '2020-02-01'])
+    })
+    compiled_df = compact_records(records.rename(columns={'id': 'id_record'}))
+
+    def convert_records(currency):
+        # two pages of converted records
+        converted = RecordList(records).convert_currency(currency=currency).to_pandas()
+        yield converted.iloc[:2][['id', 'balance']]
+        yield converted.iloc[2:][['id', 'balance']]
+
+    return CurrencyConverter(convert_records, compiled_df)
+
+
+def test_new_currency_after_append():
+    # a record created after the listing, then a currency that isn't cached yet
+    converter = make_converter()
+    converter.convert('EUR')
+
+    converter.append(compact_records(pd.DataFrame({
+        'id_record': [5],
+        'account_id': [2],
+        'balance': [3150.0],
+        'currency': ['NOK'],
+        'date': pd.to_datetime(['2020-03-01'])
+    })))
+    usd = converter.convert('USD')
+
+    expected = np.array([100.0, 110.0, 1050.0, 2100.0, 3150.0])
+    rates = np.array([CURRENCY_RATES[code] for code in ['EUR', 'EUR', 'NOK', 'NOK', 'NOK']])
+    np.testing.assert_allclose(usd['balance'].to_numpy(), expected / rates * CURRENCY_RATES['USD'])
+
+
+def test_no_finite_rates_leave_nan():
+    # the client sends no balances back, and every source balance is zero
+    records = pd.DataFrame({
+        'id_record': [1, 2, 3],
+        'account_id': [1, 1, 2],
+        'balance': [0.0, 0.0, 0.0],
+        'currency': ['EUR', 'USD', 'NOK'],
+        'date': pd.to_datetime(['2020-01-01', '2020-02-01', '2020-01-01'])
+    })
+
+    def convert_records(currency):
+        yield pd.DataFrame({'id': [1, 2, 3], 'balance': [np.nan, 0.0, 0.0]})
+
+    converter = CurrencyConverter(convert_records, compact_records(records))
+    usd = converter.convert('USD')
+    np.testing.assert_array_equal(usd['balance'].to_numpy(), [np.nan, 0.0, 0.0])
+
+    converter.append(compact_records(pd.DataFrame({
+        'id_record': [4, 5],
+        'account_id': [2, 2],
+        'balance': [5.0, 7.0],
+        'currency': ['NOK', 'USD'],
+        'date': pd.to_datetime(['2020-03-01', '2020-03-01'])
+    })))
+    np.testing.assert_array_equal(converter.convert('USD')['balance'].to_numpy()[3:], [np.nan, 7.0])
@@ -0,0 +1,20 @@
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import make_records
+from filters import LatestBalanceIndex
+
+
+def test_extended_latest_balance_index_matches_a_rebuild():
+    df = make_records(8, 400, span_days=300)
+    extra = make_records(11, 50, span_days=400)
+    extra['date'] = extra['date'] + pd.Timedelta(hours=6)
+    combined = pd.concat([df, extra], ignore_index=True)
+
+    extended = LatestBalanceIndex(df).extend(combined)
+    rebuilt = LatestBalanceIndex(combined)
+    assert extended.size == len(combined)
+    assert np.array_equal(extended.order, rebuilt.order)
+
+    for date_start, date_end in [(None, None), ('2015-03-01', '2015-09-01'), (None, '2015-02-01')]:
+        assert np.array_equal(extended.latest(date_start, date_end), rebuilt.latest(date_start, date_end))
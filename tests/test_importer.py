@@ -0,0 +1,72 @@
+import io
+
+import pytest
+
+OFX = b'''<OFX><CURDEF>NOK
+<STMTTRN><DTPOSTED>20310105<TRNAMT>-50.00</STMTTRN>
+<STMTTRN><DTPOSTED>20310107<TRNAMT>200.00</STMTTRN>
+%s
+</OFX>'''
+
+
+def csv_file(first_day, days):
+    rows = '\n'.join(f'2032-01-{day:02d},{day}' for day in range(first_day, first_day + days))
+    return io.BytesIO(f'date,balance\n{rows}\n'.encode())
+
+
+@pytest.fixture
+def importer(app_modules, monkeypatch):
+    import importer
+
+    app_modules.data.get_compiled_records()
+    monkeypatch.setitem(importer._batch_create, 'supported', None)
+    return importer
+
+
+def test_batches_and_one_change_per_import(app_modules, importer, monkeypatch):
+    client, data = app_modules.client, app_modules.data
+    create = client.records.create
+    batches = []
+
+    def create_batch(records):
+        batches.append(len(records))
+        return create(records)
+
+    monkeypatch.setattr(client.records, 'create', create_batch)
+    version = data.data_version()
+
+    report = importer.import_records(csv_file(1, 5), 'bank.csv', account_id=2, currency='EUR', batch_size=2)
+
+    assert report['inserted'] == 5
+    assert batches == [2, 2, 1]
+    assert data.data_version() == version + 1
+
+
+def test_single_creates_for_a_client_without_batches(app_modules, importer, monkeypatch):
+    client, data = app_modules.client, app_modules.data
+    create = client.records.create
+
+    def create_one(record):
+        if isinstance(record, list):
+            raise TypeError('records.create takes one record')
+        return create(record)
+
+    monkeypatch.setattr(client.records, 'create', create_one)
+    rows = len(data.get_compiled_records())
+
+    report = importer.import_records(csv_file(10, 3), 'bank.csv', account_id=3, currency='EUR', batch_size=2)
+
+    assert report['inserted'] == 3
+    assert importer._batch_create['supported'] is False
+    assert len(data.get_compiled_records()) == rows + 3
+
+
+def test_ofx_needs_a_ledger_balance_and_an_account(importer):
+    with pytest.raises(ValueError, match='LEDGERBAL'):
+        importer.import_records(io.BytesIO(OFX % b''), 'bank.ofx', account_id=2)
+
+    ledger = b'<LEDGERBAL><BALAMT>1000.00<DTASOF>20310110</LEDGERBAL>'
+    with pytest.raises(ValueError, match='account'):
+        importer.import_records(io.BytesIO(OFX % ledger), 'bank.ofx')
+
+    assert importer.import_records(io.BytesIO(OFX % ledger), 'bank.ofx', account_id=2)['inserted'] == 3
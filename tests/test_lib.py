@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+
+from lib import compact_records, concat_records, filter_table, split_filter_part
+
+
+def test_missing_ids_stay_exact():
+    # label ids past 2**24 with a gap from the left join
+    ids = [2**24 + 1, np.nan, 2**31 - 1]
+    compact = compact_records(pd.DataFrame({'label_id': ids}))
+    assert compact['label_id'].iloc[0] == 2**24 + 1
+    assert compact['label_id'].iloc[2] == 2**31 - 1
+
+    whole = compact_records(pd.DataFrame({'label_id': [2**24 + 3]}))
+    assert whole['label_id'].dtype == np.int32
+
+    combined = concat_records([whole, compact])
+    assert combined['label_id'].isna().sum() == 1
+    assert combined['label_id'].dropna().tolist() == [2**24 + 3, 2**24 + 1, 2**31 - 1]
+
+
+def test_filter_operator_follows_the_column():
+    assert split_filter_part('{description} contains "orange juice"') == ('description', 'contains', 'orange juice')
+    assert split_filter_part('{balance} >= 10') == ('balance', 'ge', 10.0)
+    assert split_filter_part('{name} eq "a ge b"') == ('name', 'eq', 'a ge b')
+    assert split_filter_part('balance > 10') == (None, None, None)
+
+
+def test_filter_values_of_another_type():
+    df = compact_records(pd.DataFrame({
+        'balance': [1.0, 5.0],
+        'name': ['3 apples', 'pears'],
+        'date': pd.to_datetime(['2020-01-01', '2021-01-01'])
+    }))
+
+    # a value that isn't a number leaves a number column unfiltered
+    assert len(filter_table(df, '{balance} > abc')) == 2
+    # a number against strings compares as text
+    assert filter_table(df, '{name} > 3')['name'].tolist() == ['3 apples', 'pears']
+    assert filter_table(df, '{name} < 4')['name'].tolist() == ['3 apples']
+    assert filter_table(df, '{date} >= 2020-06-01 && {balance} gt 2')['balance'].tolist() == [5.0]
@@ -0,0 +1,36 @@
+from benchmarks.synthetic import FakeClient, RecordList
+from query import RecordQuery, read_records
+
+
+class ListOnlyRecords:
+    # a records API whose list takes no filters and doesn't page
+
+    def __init__(self, df):
+        self.df = df
+        self.calls = 0
+
+    def list(self):
+        self.calls += 1
+        return RecordList(self.df)
+
+
+class ListOnlyClient:
+
+    def __init__(self, client):
+        self.records = ListOnlyRecords(client.records.df)
+
+
+def test_client_without_pushdown_gives_the_same_frame():
+    client = FakeClient(n_accounts=10, n_records=500)
+    # a column beyond the ones the query filters on
+    client.records.df = client.records.df.assign(description='balance')
+    list_only = ListOnlyClient(client)
+
+    for query in (RecordQuery(), RecordQuery(account_ids=[2, 3], date_start='2015-03-01', after_id=100)):
+        paged = read_records(client, query, chunk_size=64)
+        listed = read_records(list_only, query, chunk_size=64)
+
+        assert list(listed.columns) == list(paged.columns)
+        assert listed.equals(paged)
+
+    assert list_only.records.calls == 2
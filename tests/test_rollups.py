@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import make_records
+from lib import create_group_totals, create_total_col
+from rollups import RollupIndex
+from totals import TotalBalance
+
+
+def test_group_lines_add_up_to_the_total():
+    df = make_records(12, 600, span_days=400)
+    df['country_code'] = np.where(df['account_id'] % 3 == 0, 'NO', 'SE')
+
+    lines = create_group_totals(df, 'balance', 'country_code')
+    total = create_total_col(df, 'balance')
+    columns = ['date', 'balance']
+    assert lines.loc[lines['name_account'] == 'Total', columns].equals(total.loc[total['name_account'] == 'Total', columns])
+
+    dates = np.unique(df['date'].to_numpy(dtype='datetime64[ns]'))
+    summed = sum(
+        TotalBalance.from_frame(rows, 'balance').at(dates.astype(np.int64))
+        for _, rows in df.groupby('country_code')
+    )
+    assert np.allclose(summed, TotalBalance.from_frame(df, 'balance').at(dates.astype(np.int64)))
+
+
+def test_auto_picks_by_visible_range():
+    rollup_index = RollupIndex(make_records(5, 200, span_days=3650))
+
+    assert rollup_index.choose('auto', '2015-01-01', '2020-01-01') == 'M'
+    assert rollup_index.choose('auto', '2015-01-01', '2016-01-01') == 'W'
+    assert rollup_index.choose('auto', '2015-01-01', '2015-03-01') == 'D'
+    assert rollup_index.choose('auto', '2015-01-01', '2015-01-20') is None
+    assert rollup_index.choose('D', '2015-01-01', '2020-01-01') == 'D'
+    assert rollup_index.choose('records', '2015-01-01', '2020-01-01') is None
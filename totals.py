@@ -0,0 +1,119 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# below this many rows per worker the threads cost more than they save
+MIN_ROWS_PER_WORKER = 100_000
+
+
+def _columns(df, balance_col):
+    accounts = df['account_id'].to_numpy(dtype=np.int64)
+    times = df['date'].to_numpy(dtype='datetime64[ns]').astype(np.int64)
+    values = df[balance_col].to_numpy(dtype=float)
+    return accounts, times, values
+
+
+def _knots(accounts, times, values):
+    # every account's records as (account, time, balance) sorted by account
+    # and time. a repeated (date, account) keeps the last record, like the
+    # drop_duplicates before the old pivot.
+    keep = ~np.isnan(values)
+    accounts, times, values = accounts[keep], times[keep], values[keep]
+    if not len(accounts):
+        return accounts, times, values
+
+    order = np.lexsort((np.arange(len(accounts)), times, accounts))
+    accounts, times, values = accounts[order], times[order], values[order]
+    last = np.r_[(accounts[1:] != accounts[:-1]) | (times[1:] != times[:-1]), True]
+
+    return accounts[last], times[last], values[last]
+
+
+def _events(knots, dates):
+    # per date, the sum of the slope changes and of the jumps where an
+    # account starts, of the accounts in knots. sums over disjoint sets of
+    # accounts add up to the sum over all of them.
+    accounts, times, values = knots
+    same = accounts[1:] == accounts[:-1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        segments = np.where(same, np.diff(values) / np.diff(times), 0.0)
+    slope_changes = np.r_[segments, 0.0] - np.r_[0.0, segments]
+    jumps = np.where(np.r_[True, ~same], values, 0.0)
+
+    positions = np.searchsorted(dates, times)
+    return (
+        np.bincount(positions, slope_changes, minlength=len(dates)),
+        np.bincount(positions, jumps, minlength=len(dates))
+    )
+
+
+class TotalBalance:
+    # the sum over accounts of each account's balance, interpolated linearly
+    # in time between its records, held after its last one and zero before
+    # its first. that sum is piecewise linear with kinks and jumps only on
+    # record dates, so it is kept at those dates alone: the total on each date
+    # and the slope after it. memory grows with the number of records, not
+    # with accounts x dates like a pivoted matrix.
+
+    def __init__(self, times, totals, slopes):
+        self.times = times
+        self.totals = totals
+        self.slopes = slopes
+
+    @classmethod
+    def from_frame(cls, df, balance_col, workers=1):
+        # with workers > 1 the accounts are split between threads, the numpy
+        # sorts and sums release the GIL. each thread finds its accounts'
+        # knots and dates, then adds up its events on the merged dates.
+        accounts, times, values = _columns(df, balance_col)
+        workers = max(1, min(workers, len(accounts) // MIN_ROWS_PER_WORKER))
+
+        if workers == 1:
+            knots = [_knots(accounts, times, values)]
+            dates = np.unique(times)
+            events = [_events(knots[0], dates)]
+        else:
+            parts = [accounts % workers == worker for worker in range(workers)]
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='total') as pool:
+                knots = list(pool.map(lambda part: _knots(accounts[part], times[part], values[part]), parts))
+                dates = np.unique(np.concatenate(list(pool.map(lambda part: np.unique(times[part]), parts))))
+                events = list(pool.map(lambda part_knots: _events(part_knots, dates), knots))
+
+        # one sweep over the dates in order
+        slopes = np.cumsum(np.sum([slope_changes for slope_changes, jumps in events], axis=0))
+        steps = np.sum([jumps for slope_changes, jumps in events], axis=0)
+        steps[1:] += slopes[:-1] * np.diff(dates)
+
+        return cls(dates, np.cumsum(steps), slopes)
+
+    def _segments(self, times):
+        return np.searchsorted(self.times, times, side='right') - 1
+
+    def at(self, times):
+        # the total at any int64 ns times, not only the stored dates
+        i = self._segments(times)
+        inside = i >= 0
+        result = np.zeros(len(times))
+        result[inside] = self.totals[i[inside]] + self.slopes[i[inside]] * (times[inside] - self.times[i[inside]])
+        return result
+
+    def slope_at(self, times):
+        i = self._segments(times)
+        return np.where(i >= 0, self.slopes[np.maximum(i, 0)], 0.0)
+
+    def update(self, old_df, new_df, account_id, balance_col):
+        # the total after account_id's records changed from old_df's to
+        # new_df's: swap its old curve for the new one, leaving the other
+        # accounts alone
+        old = TotalBalance.from_frame(old_df[old_df['account_id'] == account_id], balance_col)
+        new = TotalBalance.from_frame(new_df[new_df['account_id'] == account_id], balance_col)
+        times = np.union1d(self.times, new.times)
+
+        return TotalBalance(
+            times,
+            self.at(times) - old.at(times) + new.at(times),
+            self.slope_at(times) - old.slope_at(times) + new.slope_at(times)
+        )
+
+    def dates(self):
+        return self.times.astype('datetime64[ns]')
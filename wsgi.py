@@ -0,0 +1,10 @@
+# production entry point, run with `gunicorn -c gunicorn.conf.py wsgi:application`.
+# with preload_app the master imports this once: it maps the dataset and
+# builds the default frame and its indexes, then forks the workers, which
+# share those pages instead of each loading its own copy.
+from data import preload
+from index import app
+
+preload()
+
+application = app.server